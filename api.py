@@ -5,21 +5,39 @@ import datetime as dt
 from http import HTTPStatus
 from typing import Any, Dict
 
-from flask import request
+from flask import current_app, request, send_file, stream_with_context
 from flask_restful import Api, Resource
 from marshmallow import Schema, ValidationError, fields, validate
-from requests.exceptions import HTTPError
+from requests.exceptions import RequestException
+from sqlalchemy.exc import SQLAlchemyError
 
+from bulk import export_csv, export_ndjson, import_users, iter_csv, iter_export_rows, iter_ndjson
+from fulltext import decode_cursor, search_mentions
+from keyword_stats import top_keyword_sets, top_keywords
+from metrics import time_stage
 from models.models import Users, db
 from pdf_loader import generate_pdf_report
+from profiling import PROFILE_HEADER, is_authorised, list_profiles, profile_path, render_profile_text
+from serialisation import dumps, output_json
 from services import (
+    ProviderBusy,
     add_keywords_to_user,
     delete_user_keywords,
+    delete_users,
     get_keywords_for_user,
-    perform_search,
+    get_rank_history,
+    build_user_query,
+    get_user_regions,
+    iter_batch_searches,
+    load_users_with_keywords,
+    normalise_keyword,
+    perform_regional_search,
+    record_search,
 )
+from trends import PERIODS, get_trends
 
 api = Api(prefix="/api")
+api.representation("application/json")(output_json)
 
 
 class UserSchema(Schema):
@@ -58,11 +76,72 @@ class SearchSchema(Schema):
         load_default=list,
     )
     generate_pdf = fields.Bool(load_default=False)
+    by_region = fields.Bool(load_default=False)
+
+
+class BatchSearchSchema(Schema):
+    telegram_ids = fields.List(
+        fields.Str(validate=validate.Length(min=1, max=64)),
+        required=True,
+        validate=validate.Length(min=1, max=1000),
+    )
+
+
+class BulkDeleteSchema(Schema):
+    telegram_ids = fields.List(
+        fields.Str(validate=validate.Length(min=1, max=64)),
+        required=True,
+        validate=validate.Length(min=1, max=10000),
+    )
+
+
+class TopKeywordsSchema(Schema):
+    limit = fields.Int(load_default=10, validate=validate.Range(min=1, max=100))
+
+
+class RankingsSchema(Schema):
+    telegram_id = fields.Str(required=True, validate=validate.Length(min=1, max=64))
+    region = fields.Str(load_default=None, validate=validate.Length(max=30))
+    limit = fields.Int(load_default=100, validate=validate.Range(min=1, max=1000))
+
+
+class TrendsSchema(Schema):
+    telegram_id = fields.Str(required=True, validate=validate.Length(min=1, max=64))
+    keyword = fields.Str(load_default=None, validate=validate.Length(min=1, max=50))
+    period = fields.Str(load_default="day", validate=validate.OneOf(PERIODS))
+    since = fields.Date(load_default=None)
+    until = fields.Date(load_default=None)
+
+
+class CursorField(fields.Str):
+    """An opaque page cursor, loaded as a ``(created_at, id)`` pair."""
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            return decode_cursor(super()._deserialize(value, attr, data, **kwargs))
+        except ValueError as exc:
+            raise ValidationError(str(exc)) from exc
+
+
+class MentionSearchSchema(Schema):
+    query = fields.Str(required=True, validate=validate.Length(min=1, max=200))
+    telegram_id = fields.Str(load_default=None, validate=validate.Length(min=1, max=64))
+    keyword = fields.Str(load_default=None, validate=validate.Length(min=1, max=50))
+    since = fields.DateTime(load_default=None)
+    until = fields.DateTime(load_default=None)
+    cursor = CursorField(load_default=None)
+    per_page = fields.Int(load_default=20, validate=validate.Range(min=1, max=100))
 
 
 user_schema = UserSchema()
 keyword_schema = KeywordSchema()
 search_schema = SearchSchema()
+batch_search_schema = BatchSearchSchema()
+bulk_delete_schema = BulkDeleteSchema()
+top_keywords_schema = TopKeywordsSchema()
+rankings_schema = RankingsSchema()
+trends_schema = TrendsSchema()
+mention_search_schema = MentionSearchSchema()
 
 
 class UserRegister(Resource):
@@ -82,6 +161,35 @@ class UserRegister(Resource):
         return {"status": "ok", "user": user.to_dict()}, HTTPStatus.CREATED
 
 
+class UserImport(Resource):
+    """Register many users from an NDJSON or CSV request body."""
+
+    def post(self):
+        if request.mimetype == "text/csv":
+            rows = iter_csv(request.stream)
+        elif request.mimetype in ("application/x-ndjson", "application/jsonl"):
+            rows = iter_ndjson(request.stream)
+        else:
+            return {
+                "status": "validation_error",
+                "message": "Send application/x-ndjson or text/csv",
+            }, HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+        report = import_users(rows, user_schema)
+        return {"status": "ok", **report}, HTTPStatus.OK
+
+
+class UserExport(Resource):
+    """Stream every user with their keywords as NDJSON or CSV."""
+
+    def get(self):
+        if request.args.get("format") == "csv":
+            body, mimetype = export_csv(iter_export_rows()), "text/csv"
+        else:
+            body, mimetype = export_ndjson(iter_export_rows()), "application/x-ndjson"
+        return current_app.response_class(stream_with_context(body), mimetype=mimetype)
+
+
 class CheckUser(Resource):
     """Check whether a user exists."""
 
@@ -142,6 +250,24 @@ class CheckKeyWords(Resource):
         return {"status": "ok", "removed": removed}, HTTPStatus.OK
 
 
+class TopKeywords(Resource):
+    """Most followed keywords and keyword sets, read from maintained counters."""
+
+    def get(self):
+        try:
+            payload = top_keywords_schema.load(request.args)
+        except ValidationError as exc:
+            return {"status": "validation_error", "errors": exc.messages}, HTTPStatus.BAD_REQUEST
+
+        return {
+            "keywords": [
+                {"name": keyword.name, "subscribers": keyword.subscriber_count}
+                for keyword in top_keywords(payload["limit"])
+            ],
+            "keyword_sets": [entry.to_dict() for entry in top_keyword_sets(payload["limit"])],
+        }, HTTPStatus.OK
+
+
 class Search(Resource):
     """Perform a monitoring search and optionally generate a PDF report."""
 
@@ -151,25 +277,38 @@ class Search(Resource):
         except ValidationError as exc:
             return {"status": "validation_error", "errors": exc.messages}, HTTPStatus.BAD_REQUEST
 
-        user = Users.find_by_telegram_id(payload["telegram_id"])
-        if not user:
-            return {"status": "user_not_found"}, HTTPStatus.NOT_FOUND
+        with time_stage("search.lookup"):
+            user = Users.find_by_telegram_id(payload["telegram_id"])
+            if not user:
+                return {"status": "user_not_found"}, HTTPStatus.NOT_FOUND
 
-        keywords = payload["keywords"] or get_keywords_for_user(user)
+            keywords = payload["keywords"] or get_keywords_for_user(user)
         if not keywords:
             return {"status": "no_keywords", "message": "No keywords available"}, HTTPStatus.BAD_REQUEST
 
-        query = " ".join(filter(None, [user.name, user.surname, user.patronymic or ""]))
+        query = build_user_query(user)
+        regions = get_user_regions(user) if payload["by_region"] else []
         try:
-            results = perform_search(query, keywords)
-        except HTTPError as exc:
+            with time_stage("search.upstream"):
+                regional = perform_regional_search(query, keywords, regions or [None])
+        except ProviderBusy as exc:
+            return {
+                "status": "provider_busy",
+                "message": str(exc),
+            }, HTTPStatus.SERVICE_UNAVAILABLE
+        except RequestException as exc:
             return {
                 "status": "search_error",
                 "message": str(exc),
             }, HTTPStatus.BAD_GATEWAY
 
+        with time_stage("search.record"):
+            rankings = record_search(user, query, keywords, regional)
+        results = next(iter(regional.values()))
+
         if payload["generate_pdf"]:
-            filename = generate_pdf_report(user, results)
+            with time_stage("search.pdf"):
+                filename = generate_pdf_report(user, results)
         else:
             filename = None
 
@@ -178,11 +317,173 @@ class Search(Resource):
             "results": results,
             "generated_at": dt.datetime.utcnow().isoformat() + "Z",
         }
+        if regions:
+            response["regions"] = [
+                {"region": region, "results": found, "own_links": rankings[region]}
+                for region, found in regional.items()
+            ]
+        else:
+            response["own_links"] = rankings[None]
         if filename:
             response["pdf_report"] = filename
         return response, HTTPStatus.OK
 
 
+class BatchSearch(Resource):
+    """Search for many users at once, streaming one NDJSON line per user."""
+
+    def post(self):
+        try:
+            payload = batch_search_schema.load(request.get_json(force=True))
+        except ValidationError as exc:
+            return {"status": "validation_error", "errors": exc.messages}, HTTPStatus.BAD_REQUEST
+
+        requested = list(dict.fromkeys(payload["telegram_ids"]))
+        with time_stage("batch_search.lookup"):
+            users = load_users_with_keywords(requested)
+
+        def generate():
+            found = {user.telegram_id for user in users}
+            for telegram_id in requested:
+                if telegram_id not in found:
+                    yield _ndjson_line({"telegram_id": telegram_id, "status": "user_not_found"})
+
+            for user, query, keywords, results, error in iter_batch_searches(users):
+                line = {"telegram_id": user.telegram_id}
+                if not keywords:
+                    line["status"] = "no_keywords"
+                elif error is not None:
+                    line.update(status="search_error", message=str(error))
+                else:
+                    try:
+                        with time_stage("batch_search.record"):
+                            rankings = record_search(user, query, keywords, {None: results})
+                    except SQLAlchemyError:
+                        # The 200 status is already sent; report this user and go on.
+                        db.session.rollback()
+                        current_app.logger.exception("Storing batch search results failed")
+                        line.update(status="search_error", message="Could not store results")
+                    else:
+                        line.update(
+                            status="ok",
+                            results=results,
+                            own_links=rankings[None],
+                            generated_at=dt.datetime.utcnow().isoformat() + "Z",
+                        )
+                yield _ndjson_line(line)
+
+        return current_app.response_class(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+
+def _ndjson_line(data: Dict[str, Any]) -> str:
+    return dumps(data) + "\n"
+
+
+class Rankings(Resource):
+    """Return the rank history of a user's own links."""
+
+    def get(self):
+        try:
+            payload = rankings_schema.load(request.get_json(force=True))
+        except ValidationError as exc:
+            return {"status": "validation_error", "errors": exc.messages}, HTTPStatus.BAD_REQUEST
+
+        user = Users.find_by_telegram_id(payload["telegram_id"])
+        if not user:
+            return {"status": "user_not_found"}, HTTPStatus.NOT_FOUND
+
+        history = get_rank_history(user, payload["region"], payload["limit"])
+        return {"rankings": [entry.to_dict() for entry in history]}, HTTPStatus.OK
+
+
+class Trends(Resource):
+    """Return pre-aggregated counts of new negative mentions."""
+
+    def get(self):
+        try:
+            payload = trends_schema.load(request.get_json(force=True))
+        except ValidationError as exc:
+            return {"status": "validation_error", "errors": exc.messages}, HTTPStatus.BAD_REQUEST
+
+        user = Users.find_by_telegram_id(payload["telegram_id"])
+        if not user:
+            return {"status": "user_not_found"}, HTTPStatus.NOT_FOUND
+
+        keyword = normalise_keyword(payload["keyword"]) if payload["keyword"] else None
+        rollups = get_trends(
+            user.id, payload["period"], keyword, payload["since"], payload["until"]
+        )
+        return {
+            "period": payload["period"],
+            "trends": [rollup.to_dict() for rollup in rollups],
+        }, HTTPStatus.OK
+
+
+class MentionSearch(Resource):
+    """Full-text search over stored mention headlines and snippets."""
+
+    def get(self):
+        try:
+            payload = mention_search_schema.load(request.get_json(force=True))
+        except ValidationError as exc:
+            return {"status": "validation_error", "errors": exc.messages}, HTTPStatus.BAD_REQUEST
+
+        user_id = None
+        if payload["telegram_id"]:
+            user = Users.find_by_telegram_id(payload["telegram_id"])
+            if not user:
+                return {"status": "user_not_found"}, HTTPStatus.NOT_FOUND
+            user_id = user.id
+
+        keyword = normalise_keyword(payload["keyword"]) if payload["keyword"] else None
+        rows, next_cursor = search_mentions(
+            payload["query"],
+            user_id=user_id,
+            keyword=keyword,
+            since=payload["since"],
+            until=payload["until"],
+            cursor=payload["cursor"],
+            per_page=payload["per_page"],
+        )
+        return {
+            "mentions": [
+                {**mention.to_dict(), "telegram_id": telegram_id} for mention, telegram_id in rows
+            ],
+            "per_page": payload["per_page"],
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+        }, HTTPStatus.OK
+
+
+class ProfileList(Resource):
+    """List recently captured request profiles."""
+
+    def get(self):
+        if not is_authorised(request.headers.get(PROFILE_HEADER)):
+            return {"status": "forbidden"}, HTTPStatus.FORBIDDEN
+
+        limit = request.args.get("limit", 50, type=int)
+        return {"profiles": list_profiles(max(1, min(limit, 500)))}, HTTPStatus.OK
+
+
+class ProfileDownload(Resource):
+    """Download a captured profile as pstats or as a text summary."""
+
+    def get(self, profile_id):
+        if not is_authorised(request.headers.get(PROFILE_HEADER)):
+            return {"status": "forbidden"}, HTTPStatus.FORBIDDEN
+
+        path = profile_path(profile_id)
+        if path is None:
+            return {"status": "profile_not_found"}, HTTPStatus.NOT_FOUND
+
+        if request.args.get("format") == "text":
+            return current_app.response_class(render_profile_text(path), mimetype="text/plain")
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True)
+
+
 class Result(Resource):
     """Return keywords that were used for previous searches."""
 
@@ -228,16 +529,45 @@ class UserDelete(Resource):
         if not user:
             return {"status": "user_not_found"}, HTTPStatus.NOT_FOUND
 
-        db.session.delete(user)
-        db.session.commit()
+        delete_users([user.id])
         return {"status": "ok"}, HTTPStatus.OK
 
 
+class BulkUserDelete(Resource):
+    """Offboard many users in one call."""
+
+    def delete(self):
+        try:
+            payload = bulk_delete_schema.load(request.get_json(force=True) or {})
+        except ValidationError as exc:
+            return {"status": "validation_error", "errors": exc.messages}, HTTPStatus.BAD_REQUEST
+
+        telegram_ids = list(dict.fromkeys(payload["telegram_ids"]))
+        found = dict(
+            db.session.execute(
+                db.select(Users.telegram_id, Users.id).where(Users.telegram_id.in_(telegram_ids))
+            ).all()
+        )
+        deleted = delete_users(list(found.values()))
+        not_found = [telegram_id for telegram_id in telegram_ids if telegram_id not in found]
+        return {"status": "ok", "deleted": deleted, "not_found": not_found}, HTTPStatus.OK
+
+
 def register_resources(app):
     api.add_resource(UserRegister, "/register")
+    api.add_resource(UserImport, "/users/import")
+    api.add_resource(UserExport, "/users/export")
+    api.add_resource(BulkUserDelete, "/users/bulk")
     api.add_resource(CheckUser, "/check-user")
     api.add_resource(CheckKeyWords, "/check-keywords")
+    api.add_resource(TopKeywords, "/keywords/top")
     api.add_resource(Search, "/search")
+    api.add_resource(BatchSearch, "/search/batch")
+    api.add_resource(Rankings, "/rankings")
+    api.add_resource(Trends, "/trends")
+    api.add_resource(MentionSearch, "/mentions/search")
+    api.add_resource(ProfileList, "/profiles")
+    api.add_resource(ProfileDownload, "/profiles/<string:profile_id>")
     api.add_resource(Result, "/result")
     api.add_resource(UserData, "/user-data")
     api.add_resource(UserDelete, "/user")
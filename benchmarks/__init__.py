@@ -0,0 +1,4 @@
+"""Benchmarks for the SERM Monitoring hot paths.
+
+Run ``python -m benchmarks.run --help`` from the repository root.
+"""
@@ -0,0 +1,113 @@
+"""Local stand-in for the Telegram Bot API.
+
+Every ``POST /bot<token>/<method>`` succeeds. Outgoing ``sendMessage`` and
+``sendDocument`` calls are recorded per chat so a load test can check what
+the bot answered, and the server returns a minimal ``Message`` for them.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import defaultdict
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs
+
+Reply = Tuple[str, str]  # (method, text or file name)
+
+
+def _parse_form(content_type: str, body: bytes) -> Dict[str, str]:
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            filename = part.get_filename()
+            fields[name] = filename if filename else part.get_content()
+        return fields
+    if content_type.startswith("application/json"):
+        return {key: str(value) for key, value in json.loads(body or b"{}").items()}
+    return {key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+
+class FakeTelegram:
+    """Serve a minimal Bot API on a background thread."""
+
+    def __init__(self, latency_ms: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency_ms = latency_ms
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._replies: Dict[int, List[Reply]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._message_id = 0
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):  # noqa: N802 - http.server naming
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                fields = _parse_form(self.headers.get("Content-Type", ""), body)
+                if owner.latency_ms:
+                    time.sleep(owner.latency_ms / 1000)
+                payload = json.dumps({"ok": True, "result": owner._handle(method, fields)})
+                encoded = payload.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format, *args):  # noqa: A002 - silence access log
+                return
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def _handle(self, method: str, fields: Dict[str, str]):
+        with self._lock:
+            self.calls[method] += 1
+            if method not in ("sendMessage", "sendDocument"):
+                return True
+            self._message_id += 1
+            message_id = self._message_id
+            chat_id = int(fields.get("chat_id", 0))
+            text = fields.get("text") or fields.get("document") or ""
+            self._replies[chat_id].append((method, text))
+
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if method == "sendDocument":
+            message["document"] = {"file_id": f"doc{message_id}", "file_unique_id": f"u{message_id}"}
+        else:
+            message["text"] = text
+        return message
+
+    def replies(self, chat_id: int, start: int = 0) -> List[Reply]:
+        """Return what the bot sent to ``chat_id``, from index ``start`` on."""
+
+        with self._lock:
+            return list(self._replies[chat_id][start:])
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FakeTelegram":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+__all__ = ["FakeTelegram"]
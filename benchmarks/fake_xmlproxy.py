@@ -0,0 +1,119 @@
+"""Local stand-in for the XMLProxy search API.
+
+The server answers every GET with Yandex-style XML whose size and shape are
+controlled by :class:`ProviderConfig`, after an optional artificial delay. A
+share of requests can be failed with ``error_status`` to exercise error paths.
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+HEADLINE_WORDS = ("Скандал", "вокруг", "депутата", "городской", "думы")
+PASSAGE_WORDS = (
+    "Сегодня", "стало", "известно", "что", "чиновник", "задержан", "по", "делу",
+    "о", "коррупции", "и", "мошенничестве", "в", "крупном", "размере",
+)
+
+
+@dataclass
+class ProviderConfig:
+    results: int = 50
+    passages: str = "list"  # "single" or "list"
+    headline: str = "dict"  # "dict" or "str"
+    passage_words: int = 30
+    latency_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 502
+
+
+def _words(pool, count: int, offset: int) -> str:
+    return " ".join(pool[(offset + index) % len(pool)] for index in range(count))
+
+
+def build_response(config: ProviderConfig) -> str:
+    """Return an XML document shaped like an XMLProxy answer."""
+
+    groups = []
+    for index in range(config.results):
+        headline_text = escape(_words(HEADLINE_WORDS, 4, index))
+        if config.headline == "dict":
+            headline = f"<headline><hlword>{escape(HEADLINE_WORDS[0])}</hlword> {headline_text}</headline>"
+        else:
+            headline = f"<headline>{headline_text}</headline>"
+
+        passage_count = 1 if config.passages == "single" else 3
+        passages = "".join(
+            f"<passage>{escape(_words(PASSAGE_WORDS, config.passage_words, index + part))}"
+            f" <hlword>{escape(PASSAGE_WORDS[5])}</hlword></passage>"
+            for part in range(passage_count)
+        )
+        groups.append(
+            "<group><doc>"
+            f"<url>https://news{index % 7}.example.ru/article/{index}?utm_source=yandex</url>"
+            f"{headline}<passages>{passages}</passages>"
+            "</doc></group>"
+        )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        "<yandexsearch><response><results><grouping>"
+        f"{''.join(groups)}"
+        "</grouping></results></response></yandexsearch>"
+    )
+
+
+class FakeXMLProxy:
+    """Serve :func:`build_response` on a background thread."""
+
+    def __init__(self, config: ProviderConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or ProviderConfig()
+        self._body = build_response(self.config).encode("utf-8")
+        self.requests = 0
+        self.errors = 0
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802 - http.server naming
+                owner.requests += 1
+                if owner.config.latency_ms:
+                    time.sleep(owner.config.latency_ms / 1000)
+                if owner.config.error_rate and random.random() < owner.config.error_rate:
+                    owner.errors += 1
+                    self.send_error(owner.config.error_status)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(owner._body)))
+                self.end_headers()
+                self.wfile.write(owner._body)
+
+            def log_message(self, format, *args):  # noqa: A002 - silence access log
+                return
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/search/?user=bench&key=bench"
+
+    def reconfigure(self, config: ProviderConfig) -> None:
+        self.config = config
+        self._body = build_response(config).encode("utf-8")
+
+    def __enter__(self) -> "FakeXMLProxy":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+__all__ = ["FakeXMLProxy", "ProviderConfig", "build_response"]
@@ -0,0 +1,418 @@
+"""Load test for the Telegram bot -> API -> provider flow.
+
+Simulated chats send their updates straight into the bot's ``dp`` handlers.
+The bot talks to a local fake Bot API server and to the real Flask API, and
+the API talks to the fake XMLProxy. Examples::
+
+    python -m benchmarks.load_bot --chats 200 --concurrency 50
+    python -m benchmarks.load_bot --chats 500 --returning-share 0.5 \\
+        --provider-latency-ms 300 --provider-error-rate 0.05 --output load.json
+
+The report includes end-to-end chat latency percentiles, throughput, latency
+and failure reasons for each conversation step, and the same for each API
+call made by the bot. The bot dependencies (aiogram 2, asgiref) must be
+installed.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextvars
+import datetime as dt
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.fake_telegram import FakeTelegram  # noqa: E402
+from benchmarks.fake_xmlproxy import FakeXMLProxy, ProviderConfig  # noqa: E402
+from benchmarks.run import _latency_metrics  # noqa: E402
+
+# A syntactically valid token; the fake Bot API accepts any.
+FAKE_TOKEN = "123456789:load-test-token"
+CHAT_ID_BASE = 7_000_000_000
+API_QUERIES = (
+    "check_user",
+    "register_user",
+    "post_words",
+    "get_result",
+    "result",
+    "delete_keywords",
+    "get_user_data",
+)
+# Every error message of the bot carries this marker.
+BOT_ERROR_MARK = "⚠"
+
+
+@dataclass
+class Step:
+    name: str
+    text: Callable[[int], str]
+    expect: str
+    callback: bool = False
+
+
+NEW_USER_SCRIPT = [
+    Step("start", lambda n: "/start", "Укажите ваше имя"),
+    Step("name", lambda n: "Иван", "фамилию"),
+    Step("surname", lambda n: f"Нагрузкин{n}", "отчество"),
+    Step("patronymic", lambda n: "Петрович", "дату рождения"),
+    Step("date_of_birth", lambda n: "01.02.1990", "номер телефона"),
+    Step("phone", lambda n: f"79{n:09d}", "город"),
+    Step("city", lambda n: "Москва", "Введенные данные верны"),
+    Step("accept", lambda n: "accept", "ключевые слова", callback=True),
+    Step("keywords", lambda n: "коррупция, суд", "Отчет предоставлен"),
+    Step("amount", lambda n: "4", "До свидания"),
+]
+RETURNING_USER_SCRIPT = [
+    Step("start", lambda n: "/start", "Ключевые слова, по которым"),
+    Step("add", lambda n: "add", "Введите новые", callback=True),
+    Step("keywords", lambda n: "скандал", "Отчет предоставлен"),
+]
+
+
+class Recorder:
+    """Durations and failure reasons grouped by name."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.failures: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, name: str, seconds: float, failure: Optional[str] = None) -> None:
+        self.samples[name].append(seconds)
+        if failure:
+            self.failures[name][failure] += 1
+
+    def summary(self) -> Dict[str, Dict[str, object]]:
+        return {
+            name: {
+                "count": len(samples),
+                "failed": sum(self.failures[name].values()),
+                **_latency_metrics(samples),
+                "failure_reasons": dict(self.failures[name].most_common()),
+            }
+            for name, samples in sorted(self.samples.items())
+        }
+
+
+def _call_failure(name: str, value: object) -> Optional[str]:
+    """Classify the return value of an ``api_queries`` helper."""
+
+    if name == "check_user":
+        return "status 400" if value == 400 else None
+    if name == "post_words":
+        return None if value.ok else f"status {value.status_code}"
+    if name == "delete_keywords":
+        return None if value < 400 else f"status {value}"
+    if name in ("register_user", "get_result", "get_user_data"):
+        return None if value else "no result"
+    return None  # ``result`` returns None when the user has no keywords yet
+
+
+def instrument_api_queries(module, recorder: Recorder) -> None:
+    """Time every API helper the handlers call, in the handler module's namespace."""
+
+    for name in API_QUERIES:
+        original = getattr(module, name)
+
+        async def timed(*args, _name=name, _original=original, **kwargs):
+            started = time.perf_counter()
+            try:
+                value = await _original(*args, **kwargs)
+            except Exception as exc:
+                recorder.record(_name, time.perf_counter() - started, type(exc).__name__)
+                raise
+            recorder.record(_name, time.perf_counter() - started, _call_failure(_name, value))
+            return value
+
+        setattr(module, name, timed)
+
+
+def _user(chat_id: int) -> Dict[str, object]:
+    return {"id": chat_id, "is_bot": False, "first_name": "Load", "last_name": str(chat_id)}
+
+
+def _message(message_id: int, chat_id: int, text: str, sender: Dict[str, object]) -> Dict[str, object]:
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": sender,
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return message
+
+
+def build_update(update_id: int, chat_id: int, step: Step, index: int):
+    from aiogram import types
+
+    text = step.text(index)
+    if step.callback:
+        bot_user = {"id": 1, "is_bot": True, "first_name": "SERM"}
+        payload = {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": _user(chat_id),
+                "message": _message(update_id, chat_id, "", bot_user),
+                "chat_instance": str(chat_id),
+                "data": text,
+            },
+        }
+    else:
+        payload = {"update_id": update_id, "message": _message(update_id, chat_id, text, _user(chat_id))}
+    return types.Update.to_object(payload)
+
+
+def _step_failure(step: Step, replies: List[str], error: Optional[BaseException]) -> Optional[str]:
+    if error is not None:
+        return f"{type(error).__name__}: {str(error)[:80]}"
+    for text in replies:
+        if BOT_ERROR_MARK in text:
+            return text.splitlines()[0][:80]
+    if not any(step.expect in text for text in replies):
+        return f"unexpected reply: {replies[-1][:60]}" if replies else "no reply"
+    return None
+
+
+async def run_chat(
+    dp, telegram: FakeTelegram, index: int, script: List[Step], update_ids, think_ms: float,
+    stages: Recorder, stop_on_failure: bool, base_context: contextvars.Context,
+) -> Dict[str, object]:
+    chat_id = CHAT_ID_BASE + index
+    total = 0.0
+    failed_steps = 0
+    for step in script:
+        if think_ms:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * think_ms / 1000)
+        seen = len(telegram.replies(chat_id))
+        error = None
+        started = time.perf_counter()
+        try:
+            # Like polling, each update runs in its own task so aiogram's
+            # per-update context variables (such as the cached FSM state) reset.
+            update = build_update(next(update_ids), chat_id, step, index)
+            await base_context.copy().run(asyncio.create_task, dp.process_update(update))
+        except Exception as exc:  # a handler crash is a failed step, not a harness error
+            error = exc
+        elapsed = time.perf_counter() - started
+        total += elapsed
+
+        replies = [text for _, text in telegram.replies(chat_id, seen)]
+        failure = _step_failure(step, replies, error)
+        stages.record(step.name, elapsed, failure)
+        if failure:
+            failed_steps += 1
+            if stop_on_failure:
+                break
+    return {"seconds": total, "failed_steps": failed_steps}
+
+
+def _serve_api(database_url: str, reports_dir: Path):
+    """Start the Flask API on a free port and return ``(host, server)``."""
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    os.environ["DATABASE_URL"] = database_url
+    import pdf_loader
+    from __init__ import create_app
+    from models.models import db
+
+    # Reports are written by the API and read back by the bot's send_document.
+    pdf_loader.REPORTS_DIR = reports_dir
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"127.0.0.1:{server.server_port}/api/", server
+
+
+def _preregister(api_host: str, indexes: List[int]) -> None:
+    lines = [
+        json.dumps(
+            {
+                "name": "Иван",
+                "surname": f"Нагрузкин{index}",
+                "telegram_id": str(CHAT_ID_BASE + index),
+                "phone": f"78{index:09d}",
+                "city": "Москва",
+                "keywords": ["коррупция"],
+            },
+            ensure_ascii=False,
+        )
+        for index in indexes
+    ]
+    if not lines:
+        return
+    response = requests.post(
+        f"http://{api_host}users/import",
+        data="\n".join(lines).encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+        timeout=60,
+    )
+    response.raise_for_status()
+
+
+async def _drive(
+    args: argparse.Namespace, telegram: FakeTelegram, returning: set
+) -> Dict[str, object]:
+    from aiogram import Bot, Dispatcher
+
+    from bot_telegram.handlers import create_advertisement
+    from bot_telegram.handlers import dp
+    from bot_telegram.loader import bot
+
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    base_context = contextvars.copy_context()
+    api_calls = Recorder()
+    stages = Recorder()
+    instrument_api_queries(create_advertisement, api_calls)
+
+    update_ids = itertools.count(1)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(index: int):
+        script = RETURNING_USER_SCRIPT if index in returning else NEW_USER_SCRIPT
+        async with semaphore:
+            return await run_chat(
+                dp, telegram, index, script, update_ids, args.think_ms, stages,
+                args.stop_on_failure, base_context,
+            )
+
+    started = time.perf_counter()
+    chats = await asyncio.gather(*(one(index) for index in range(args.chats)))
+    wall = time.perf_counter() - started
+    session = await bot.get_session()
+    await session.close()
+
+    updates = sum(len(samples) for samples in stages.samples.values())
+    failed = sum(1 for chat in chats if chat["failed_steps"])
+    return {
+        "chats": {
+            "total": args.chats,
+            "returning": len(returning),
+            "completed": args.chats - failed,
+            "failed": failed,
+            "failure_rate": failed / args.chats,
+            "wall_seconds": wall,
+            "chats_per_sec": args.chats / wall,
+            "updates_per_sec": updates / wall,
+            **_latency_metrics([chat["seconds"] for chat in chats]),
+        },
+        "stages": stages.summary(),
+        "api_calls": api_calls.summary(),
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    os.chdir(REPO_ROOT)
+    provider = ProviderConfig(
+        results=args.provider_results,
+        latency_ms=args.provider_latency_ms,
+        error_rate=args.provider_error_rate,
+    )
+    with FakeXMLProxy(provider) as proxy, FakeTelegram(args.telegram_latency_ms) as telegram, \
+            tempfile.TemporaryDirectory() as data_dir:
+        os.environ["XMLPROXY_URL"] = proxy.url
+        import xmlproxy
+
+        xmlproxy.USER_API = proxy.url
+
+        server = None
+        api_host = args.api_host
+        if api_host is None:
+            database_url = args.database_url or f"sqlite:///{Path(data_dir) / 'load.sqlite'}"
+            api_host, server = _serve_api(database_url, Path(data_dir) / "reports")
+
+        else:
+            print(f"fake XMLProxy listening on {proxy.url}", file=sys.stderr)
+
+        returning = set(
+            random.Random(args.seed).sample(range(args.chats), int(args.chats * args.returning_share))
+        )
+        _preregister(api_host, sorted(returning))
+
+        os.environ.update(TOKEN=FAKE_TOKEN, TELEGRAM_API_URL=telegram.url, API_HOST=api_host)
+        results = asyncio.run(_drive(args, telegram, returning))
+        if server is not None:
+            server.shutdown()
+
+        report = {
+            "meta": {
+                "created_at": dt.datetime.utcnow().isoformat() + "Z",
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "concurrency": args.concurrency,
+                "think_ms": args.think_ms,
+                "api_host": args.api_host or "embedded",
+                "provider": {
+                    "latency_ms": args.provider_latency_ms,
+                    "error_rate": args.provider_error_rate,
+                    "results": args.provider_results,
+                },
+                "telegram_latency_ms": args.telegram_latency_ms,
+            },
+            **results,
+            "provider": {"requests": proxy.requests, "errors": proxy.errors},
+            "telegram": dict(telegram.calls),
+        }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    print(output)
+    if args.max_failure_rate is not None and report["chats"]["failure_rate"] > args.max_failure_rate:
+        return 1
+    return 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=100, help="Number of simulated chats.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Chats in flight at once.")
+    parser.add_argument(
+        "--returning-share", type=float, default=0.0, help="Share of chats by registered users."
+    )
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between messages.")
+    parser.add_argument("--provider-latency-ms", type=float, default=0.0)
+    parser.add_argument("--provider-error-rate", type=float, default=0.0)
+    parser.add_argument("--provider-results", type=int, default=50)
+    parser.add_argument("--telegram-latency-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--api-host",
+        help="Use a running API, e.g. 127.0.0.1:8200/api/ (point its XMLPROXY_URL at your own fake).",
+    )
+    parser.add_argument("--database-url", help="Database for the embedded API (default: SQLite).")
+    parser.add_argument(
+        "--stop-on-failure", action="store_true", help="Abandon a chat after its first failed step."
+    )
+    parser.add_argument("--max-failure-rate", type=float, help="Exit 1 above this chat failure rate.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
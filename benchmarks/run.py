@@ -0,0 +1,292 @@
+"""Benchmark runner and baseline comparison.
+
+Examples::
+
+    python -m benchmarks.run run --output benchmarks/baseline.json
+    python -m benchmarks.run run --output /tmp/current.json
+    python -m benchmarks.run compare benchmarks/baseline.json /tmp/current.json
+
+``compare`` exits with status 1 when any metric regressed by more than the
+threshold (10% by default).
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.fake_xmlproxy import FakeXMLProxy, ProviderConfig  # noqa: E402
+
+SEARCH_SHAPES = [
+    ProviderConfig(results=10, passages="single", headline="str"),
+    ProviderConfig(results=50, passages="list", headline="dict"),
+    ProviderConfig(results=100, passages="list", headline="dict"),
+]
+PDF_RESULT_COUNTS = (10, 100, 1000)
+
+# Metrics where a larger value is better; everything else is a duration or size.
+HIGHER_IS_BETTER = {"ops_per_sec", "requests_per_sec"}
+
+Metrics = Dict[str, float]
+
+
+def _latency_metrics(samples: List[float]) -> Metrics:
+    """Summarise per-call durations given in seconds."""
+
+    cuts = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+    }
+
+
+def _time_calls(func: Callable[[], object], iterations: int) -> List[float]:
+    func()  # warm-up
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _shape_name(config: ProviderConfig) -> str:
+    return f"{config.results}x{config.passages}-{config.headline}"
+
+
+def bench_search(proxy: FakeXMLProxy, iterations: int) -> Dict[str, Metrics]:
+    import xmlproxy
+    from services import perform_search
+
+    results: Dict[str, Metrics] = {}
+    for config in SEARCH_SHAPES:
+        proxy.reconfigure(config)
+        name = _shape_name(config)
+
+        samples = _time_calls(lambda: xmlproxy.get_urls("Иван Иванов"), iterations)
+        results[f"get_urls[{name}]"] = {
+            "ops_per_sec": len(samples) / sum(samples),
+            **_latency_metrics(samples),
+        }
+
+        samples = _time_calls(
+            lambda: perform_search("Иван Иванов", ["коррупция", "суд"]), iterations
+        )
+        results[f"perform_search[{name}]"] = {
+            "ops_per_sec": len(samples) / sum(samples),
+            **_latency_metrics(samples),
+        }
+    return results
+
+
+def bench_pdf(iterations: int) -> Dict[str, Metrics]:
+    import pdf_loader
+
+    user = SimpleNamespace(name="Иван", surname="Иванов", telegram_id="bench")
+    template = {
+        "headline": "Скандал вокруг депутата городской думы",
+        "url": "https://news.example.ru/article/1",
+        "snippet": " ".join(["Сегодня стало известно что чиновник задержан"] * 6),
+    }
+
+    results: Dict[str, Metrics] = {}
+    with tempfile.TemporaryDirectory() as reports_dir:
+        pdf_loader.REPORTS_DIR = Path(reports_dir)
+        for count in PDF_RESULT_COUNTS:
+            rows = [{**template, "id": index} for index in range(1, count + 1)]
+            runs = max(1, iterations // max(1, count // 10))
+            samples = _time_calls(lambda: pdf_loader.generate_pdf_report(user, rows), runs)
+
+            tracemalloc.start()
+            pdf_loader.generate_pdf_report(user, rows)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[f"generate_pdf_report[{count}]"] = {
+                **_latency_metrics(samples),
+                "peak_kib": peak / 1024,
+            }
+    return results
+
+
+def bench_api(proxy: FakeXMLProxy, iterations: int, latency_ms: float) -> Dict[str, Metrics]:
+    proxy.reconfigure(ProviderConfig(results=50, latency_ms=latency_ms))
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(data_dir) / 'bench.sqlite'}"
+        from __init__ import create_app
+        from models.models import db
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        client.post(
+            "/api/register",
+            json={
+                "name": "Иван",
+                "surname": "Иванов",
+                "telegram_id": "bench",
+                "phone": "70000000000",
+                "city": "Москва",
+            },
+        )
+        client.post("/api/check-keywords", json={"telegram_id": "bench", "keywords": ["коррупция"]})
+
+        calls = {
+            "api_search": lambda: client.post("/api/search", json={"telegram_id": "bench"}),
+            "api_check_keywords": lambda: client.get(
+                "/api/check-keywords", json={"telegram_id": "bench"}
+            ),
+        }
+        results: Dict[str, Metrics] = {}
+        for name, call in calls.items():
+            samples = _time_calls(call, iterations)
+            results[name] = {
+                "requests_per_sec": len(samples) / sum(samples),
+                **_latency_metrics(samples),
+            }
+
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+    return results
+
+
+def bench_serialisation(iterations: int) -> Dict[str, Metrics]:
+    import serialisation
+
+    template = {
+        "headline": "Скандал вокруг депутата городской думы",
+        "url": "https://news.example.ru/article/1",
+        "snippet": " ".join(["Сегодня стало известно что чиновник задержан"] * 6),
+        "score": 3,
+        "matched_terms": ["задержан", "скандал"],
+        "created_at": dt.datetime(2024, 1, 1, 12, 0),
+    }
+
+    results: Dict[str, Metrics] = {}
+    for count in (10, 50, 100):
+        payload = {"results": [{**template, "id": index} for index in range(1, count + 1)]}
+        for backend, encode in serialisation.JSON_BACKENDS.items():
+            samples = _time_calls(lambda: encode(payload), iterations)
+            results[f"json.{backend}[{count}]"] = {
+                "ops_per_sec": len(samples) / sum(samples),
+                **_latency_metrics(samples),
+            }
+
+        body = serialisation.JSON_BACKENDS["stdlib"](payload)
+        for encoding in serialisation.available_encodings():
+            samples = _time_calls(lambda: serialisation.compress(body, encoding, 5), iterations)
+            compressed = serialisation.compress(body, encoding, 5)
+            results[f"compress.{encoding}[{count}]"] = {
+                **_latency_metrics(samples),
+                "size_ratio": len(compressed) / len(body),
+            }
+    return results
+
+
+def run(args: argparse.Namespace) -> int:
+    os.chdir(REPO_ROOT)
+    report: Dict[str, object] = {
+        "meta": {
+            "created_at": dt.datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "latency_ms": args.latency_ms,
+        },
+        "results": {},
+    }
+    with FakeXMLProxy() as proxy:
+        os.environ["XMLPROXY_URL"] = proxy.url
+        import xmlproxy
+
+        xmlproxy.USER_API = proxy.url
+        for config in SEARCH_SHAPES:
+            config.latency_ms = args.latency_ms
+
+        selected = set(args.only or ("search", "pdf", "api", "serialisation"))
+        if "search" in selected:
+            report["results"].update(bench_search(proxy, args.iterations))
+        if "pdf" in selected:
+            report["results"].update(bench_pdf(args.iterations))
+        if "api" in selected:
+            report["results"].update(bench_api(proxy, args.iterations, args.latency_ms))
+        if "serialisation" in selected:
+            report["results"].update(bench_serialisation(args.iterations))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    print(output)
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"]
+    current = json.loads(Path(args.current).read_text(encoding="utf-8"))["results"]
+
+    regressions = 0
+    for name in sorted(set(baseline) & set(current)):
+        for metric, old in sorted(baseline[name].items()):
+            new = current[name].get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            flag = ""
+            if change > args.threshold:
+                regressions += 1
+                flag = "  REGRESSION"
+            print(f"{name:40} {metric:18} {old:12.3f} -> {new:12.3f} ({change:+.1%}){flag}")
+
+    for name in sorted(set(baseline) - set(current)):
+        print(f"{name:40} missing from current run")
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and print a JSON report.")
+    run_parser.add_argument("--output", help="Write the JSON report to this file.")
+    run_parser.add_argument("--iterations", type=int, default=50)
+    run_parser.add_argument(
+        "--latency-ms", type=float, default=0.0, help="Artificial provider latency."
+    )
+    run_parser.add_argument(
+        "--only", action="append", choices=("search", "pdf", "api", "serialisation"), help="Repeatable."
+    )
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two JSON reports.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
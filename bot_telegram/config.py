@@ -3,6 +3,7 @@ import dotenv
 
 
 dotenv.load_dotenv()
-TOKEN = ''
+TOKEN = os.getenv("TOKEN", "")
 
-# TOKEN = os.getenv("TOKEN")
+# Alternative Bot API server, e.g. a local stand-in used by load tests.
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
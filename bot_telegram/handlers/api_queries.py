@@ -1,88 +1,117 @@
-import json, requests
+import datetime
+import json
+import os
+
+import requests
 from asgiref.sync import sync_to_async
-from flask_restful import Resource, reqparse
 
 
 headers = {
         "content-type": "application/json"
     }
 
-import requests
-import json
+HOST = os.getenv('API_HOST', '172.21.0.4:8200/')
+
+REGISTRATION_FIELDS = ('name', 'surname', 'patronymic', 'date_of_birth', 'phone', 'city')
+DATE_FORMATS = ('%d.%m.%Y', '%d.%m.%y', '%d.%b.%Y', '%d.%b.%y')
+
+
+def _iso_date(text):
+    """Дата в формате бота ('ДД.ММ.ГГГГ', '/', '-') -> ISO для API"""
+    text = text.replace('/', '.').replace('-', '.')
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _keywords_payload(data):
+    """Ключевые слова из состояния бота ('a, b') -> тело запроса /check-keywords"""
+    return {
+        'telegram_id': str(data['telegram_id']),
+        'keywords': [word.strip() for word in data.get('key_words', '').split(',') if word.strip()],
+    }
 
-HOST = '172.21.0.4:8200/'
 
 @sync_to_async
 def check_user(telegram_id):
     req = requests.post(
-        url=f'http://{HOST}check-user', 
-        headers=headers, 
-        data=json.dumps({'telegram_id': telegram_id}))
-    if req.status_code == 200:
-        data = json.loads(req.content)
-        if data['user'] == 'authorized':
-            return True
-        elif data['user'] == 'unauthorized':
-            return False
-    else:
-        return 400
+        url=f'http://{HOST}check-user',
+        headers=headers,
+        data=json.dumps({'telegram_id': str(telegram_id)}))
+    # 404 означает, что пользователь не зарегистрирован
+    if req.status_code in (200, 404):
+        return req.json().get('user') == 'authorized'
+    return 400
 
 
 @sync_to_async
 def register_user(data):
+    payload = {field: data[field] for field in REGISTRATION_FIELDS if data.get(field)}
+    payload['telegram_id'] = str(data['telegram_id'])
+    if 'date_of_birth' in payload:
+        payload['date_of_birth'] = _iso_date(payload['date_of_birth'])
     req = requests.post(
         url=f'http://{HOST}register',
-        headers=headers, 
-        data=json.dumps(data))
-    if req.status_code == 200:
-        return True
-    else:
-        return False
+        headers=headers,
+        data=json.dumps(payload))
+    return req.status_code == 201
 
 
 @sync_to_async
 def post_words(words):
     """Добавляет ключевые слова в базу"""
-    req = requests.post(url=f'http://{HOST}check-keywords', headers=headers, data=json.dumps(words))
-    # if req.ok:
-    #     return True
-    # else:
-    #     return False
-    # return False
+    req = requests.post(
+        url=f'http://{HOST}check-keywords', headers=headers, data=json.dumps(_keywords_payload(words)))
     return req
 
 
 @sync_to_async
 def get_result(words):
-    """отправляет ключевые слова на сервер и возвращает результат поиска"""
-    req = requests.get(url=f'http://{HOST}check-keywords', headers=headers, data=json.dumps(words))
+    """Запускает поиск по ключевым словам и возвращает путь к PDF-отчету"""
+    payload = _keywords_payload(words)
+    payload['generate_pdf'] = True
+    req = requests.post(url=f'http://{HOST}search', headers=headers, data=json.dumps(payload))
     if req.status_code == 200:
-        return True
-    else:
-        return False
+        return req.json()['pdf_report']
+    return False
 
 
+def _user_keywords(telegram_id):
+    req = requests.get(
+        url=f'http://{HOST}result', headers=headers, data=json.dumps({'telegram_id': str(telegram_id)}))
+    if req.status_code != 200:
+        return None
+    return req.json()['keywords']
+
 
 @sync_to_async
 def result(data):
-    req = requests.get(url=f'http://{HOST}result', headers=headers, data=json.dumps(data))
-    try:
-        data = json.loads(req.text)
-        return json.loads(data)
-    except:
+    """Ключевые слова пользователя в виде {номер: слово}"""
+    keywords = _user_keywords(data['telegram_id'])
+    if keywords is None:
         return None
+    return dict(enumerate(keywords, start=1))
 
 
 @sync_to_async
 def delete_keywords(data):
-    req = requests.delete(url=f'http://{HOST}check-keywords', headers=headers, data=json.dumps(data))
+    """Удаляет все ключевые слова пользователя"""
+    keywords = _user_keywords(data['telegram_id'])
+    if not keywords:
+        return 200 if keywords is not None else 404
+    payload = {'telegram_id': str(data['telegram_id']), 'keywords': keywords}
+    req = requests.delete(url=f'http://{HOST}check-keywords', headers=headers, data=json.dumps(payload))
     return req.status_code
 
 
 @sync_to_async
 def get_user_data(data):
-    req = requests.get(url=f'http://{HOST}user-data', headers=headers, data=json.dumps(data))
+    payload = {'telegram_id': str(data['telegram_id'])}
+    req = requests.get(url=f'http://{HOST}user-data', headers=headers, data=json.dumps(payload))
     if req.status_code == 200:
-        return json.loads(json.loads(req.text))
+        return req.json()['user']
     else:
         return False
@@ -82,10 +82,7 @@ async def get_key_words(message: types.Message, state: FSMContext):
     if not user_data or not res:
         await message.answer('Извините, сервер не отвечает. Повторите попытку позднее ⚠')
         return
-    name = user_data['name']
-    patronymic = user_data['patronymic']
-    surname = user_data['surname']
-    pdf = InputFile(path_or_bytesio=f'bot_telegram/handlers/reports/{name} {patronymic} {surname} от {now}.pdf')
+    pdf = InputFile(path_or_bytesio=res)
     await bot.send_document(telegram_id, pdf)
     await message.answer('Отчет предоставлен 📋')
 
@@ -110,6 +107,7 @@ async def save_surname(message: types.Message, state: FSMContext):
 async def save_patronymic(message: types.Message, state: FSMContext):
     patronymic = message.text
     await state.update_data(patronymic=patronymic)
+    await AuthState.next()
     await message.answer(text="4️⃣ Введите вашу дату рождения в формате 'ДД.ММ.ГГГГ'")
 
 
@@ -190,12 +188,11 @@ async def get_key_words(message: types.Message, state: FSMContext):
     await post_words(data)
     await SearchStateUn.next()
     await message.answer('Идет поиск по ключевым словам... 🔍')
-    await get_result(data)
-    user_data = data_for_registration[telegram_id]
-    name = user_data['name']
-    patronymic = user_data['patronymic']
-    surname = user_data['surname']
-    pdf = InputFile(path_or_bytesio=f'bot_telegram/handlers/reports/{name} {patronymic} {surname} от {now}.pdf')
+    res = await get_result(data)
+    if not res:
+        await message.answer('Извините, сервер не отвечает. Повторите попытку позднее ⚠')
+        return
+    pdf = InputFile(path_or_bytesio=res)
     await bot.send_document(telegram_id, pdf)
     await message.answer('Отчет предоставлен 📋')
     await message.answer('Сколько раз в месяц вы бы хотели получать отчет? 🕢')
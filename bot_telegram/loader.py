@@ -1,10 +1,12 @@
 from aiogram import Bot, Dispatcher
-from .config import *
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
+from .config import TELEGRAM_API_URL, TOKEN
 import logging
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
  
  
-bot = Bot(TOKEN, parse_mode='HTML')
+server = TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION
+bot = Bot(TOKEN, parse_mode='HTML', server=server)
 
 storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
@@ -0,0 +1,355 @@
+"""Bulk user onboarding and streaming export.
+
+Imports are read line by line from the request body, validated in chunks with
+``UserSchema`` and written with set-based statements: ``COPY`` on Postgres and
+``executemany`` inserts elsewhere. Exports page through users by primary key
+so memory use does not grow with the table.
+"""
+from __future__ import annotations
+
+import csv
+import datetime as dt
+import io
+import json
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from marshmallow import Schema, ValidationError, fields, validate
+from sqlalchemy.exc import IntegrityError
+
+from keyword_stats import adjust_subscriber_counts, apply_keyword_set_deltas, keyword_fingerprint
+from models.models import KeyWords, Users, db, subs
+from serialisation import dumps
+from services import normalise_keyword
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+CSV_KEYWORD_SEPARATOR = ";"
+CONFLICT_MESSAGE = "Conflicts with a user or keyword stored during the import; chunk skipped."
+
+USER_COLUMNS = (
+    "name",
+    "surname",
+    "patronymic",
+    "date_of_birth",
+    "telegram_id",
+    "password",
+    "phone",
+    "phone2",
+    "city",
+    "city2",
+    "city3",
+    "link",
+    "link2",
+    "link3",
+    "link4",
+    "link5",
+)
+EXPORT_COLUMNS = tuple(column for column in USER_COLUMNS if column != "password") + (
+    "keywords",
+    "created_at",
+)
+
+INSERT_COLUMNS = (*USER_COLUMNS, "keyword_fingerprint", "created_at", "updated_at")
+
+Row = Tuple[int, Dict[str, object]]
+
+# Same rules as ``KeywordSchema.keywords`` in the API.
+KEYWORDS_FIELD = fields.List(fields.Str(validate=validate.Length(min=1, max=50)))
+
+
+class RowError(ValueError):
+    """Raised for a line that cannot be decoded."""
+
+
+def iter_ndjson(stream: Iterable[bytes]) -> Iterator[Row]:
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, RowError(f"Invalid JSON: {exc}")
+            continue
+        if not isinstance(record, dict):
+            yield line_number, RowError("Each line must be a JSON object")
+            continue
+        yield line_number, record
+
+
+def iter_csv(stream: Iterable[bytes]) -> Iterator[Row]:
+    """Yield CSV records; a malformed line becomes a ``RowError``.
+
+    Reading stops at the first line that is not valid UTF-8.
+    """
+
+    lines = (line.decode("utf-8-sig") for line in stream)
+    reader = csv.DictReader(lines)
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            yield reader.line_num + 1, RowError(f"Invalid CSV: {exc}")
+            continue
+        except UnicodeDecodeError as exc:
+            yield reader.line_num + 1, RowError(f"Invalid UTF-8, rest of file skipped: {exc}")
+            return
+        cleaned = {key: value for key, value in record.items() if key and value not in ("", None)}
+        keywords = cleaned.pop("keywords", "")
+        cleaned["keywords"] = [
+            keyword for keyword in keywords.split(CSV_KEYWORD_SEPARATOR) if keyword.strip()
+        ]
+        yield reader.line_num, cleaned
+
+
+def _chunks(rows: Iterable[Row], size: int) -> Iterator[List[Row]]:
+    chunk: List[Row] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _validate_chunk(
+    schema: Schema, chunk: List[Row], errors: List[Dict[str, object]]
+) -> List[Tuple[int, Dict[str, object], List[str]]]:
+    valid = []
+    seen_ids: set = set()
+    seen_phones: set = set()
+    for line_number, record in chunk:
+        if isinstance(record, RowError):
+            errors.append({"line": line_number, "errors": {"_schema": [str(record)]}})
+            continue
+        raw_keywords = record.pop("keywords", None) or []
+        if isinstance(raw_keywords, str):
+            raw_keywords = [
+                name for name in raw_keywords.split(CSV_KEYWORD_SEPARATOR) if name.strip()
+            ]
+        messages: Dict[str, object] = {}
+        try:
+            raw_keywords = KEYWORDS_FIELD.deserialize(raw_keywords)
+        except ValidationError as exc:
+            messages["keywords"] = exc.messages
+        try:
+            payload = schema.load(record)
+        except ValidationError as exc:
+            messages.update(exc.messages)
+        if messages:
+            errors.append({"line": line_number, "errors": messages})
+            continue
+
+        phones = {payload["phone"], payload.get("phone2")} - {None}
+        if payload["telegram_id"] in seen_ids or phones & seen_phones:
+            errors.append({"line": line_number, "errors": {"_schema": ["Duplicate row in file"]}})
+            continue
+        seen_ids.add(payload["telegram_id"])
+        seen_phones |= phones
+        keywords = [normalise_keyword(name) for name in raw_keywords if name.strip()]
+        valid.append((line_number, payload, keywords))
+
+    if not valid:
+        return valid
+
+    existing_ids = {
+        telegram_id
+        for (telegram_id,) in db.session.execute(
+            db.select(Users.telegram_id).where(Users.telegram_id.in_(seen_ids))
+        )
+    }
+    existing_phones = set()
+    for column in (Users.phone, Users.phone2):
+        query = db.select(column).where(column.in_(seen_phones))
+        existing_phones |= {phone for (phone,) in db.session.execute(query)}
+
+    accepted = []
+    for line_number, payload, keywords in valid:
+        phones = {payload["phone"], payload.get("phone2")} - {None}
+        if payload["telegram_id"] in existing_ids:
+            errors.append({"line": line_number, "errors": {"telegram_id": ["User already exists."]}})
+        elif phones & existing_phones:
+            errors.append({"line": line_number, "errors": {"phone": ["Phone already registered."]}})
+        else:
+            accepted.append((line_number, payload, keywords))
+    return accepted
+
+
+def _copy_users(rows: List[Dict[str, object]]) -> None:
+    """Load ``rows`` with ``COPY ... FROM STDIN`` inside the session transaction."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in INSERT_COLUMNS])
+    buffer.seek(0)
+
+    columns = ", ".join(INSERT_COLUMNS)
+    driver_connection = db.session.connection().connection.driver_connection
+    with driver_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY users ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _insert_users(payloads: List[Dict[str, object]]) -> Dict[str, int]:
+    now = dt.datetime.utcnow()
+    rows = [
+        {
+            **{column: payload.get(column) for column in USER_COLUMNS},
+            "keyword_fingerprint": payload.get("keyword_fingerprint"),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for payload in payloads
+    ]
+    if db.session.get_bind().dialect.name == "postgresql":
+        _copy_users(rows)
+    else:
+        db.session.execute(db.insert(Users), rows)
+
+    telegram_ids = [payload["telegram_id"] for payload in payloads]
+    return dict(
+        db.session.execute(
+            db.select(Users.telegram_id, Users.id).where(Users.telegram_id.in_(telegram_ids))
+        ).all()
+    )
+
+
+def ensure_keywords(names: Iterable[str]) -> Dict[str, int]:
+    """Return ids for ``names`` (already normalised), creating missing keywords in one statement."""
+
+    names = set(names)
+    if not names:
+        return {}
+    lookup = db.select(db.func.lower(KeyWords.name), KeyWords.id).where(
+        db.func.lower(KeyWords.name).in_(names)
+    )
+    ids = dict(db.session.execute(lookup).all())
+    missing = names - ids.keys()
+    if missing:
+        now = dt.datetime.utcnow()
+        db.session.execute(
+            db.insert(KeyWords),
+            [{"name": name, "created_at": now, "updated_at": now} for name in sorted(missing)],
+        )
+        ids = dict(db.session.execute(lookup).all())
+    return ids
+
+
+def _write_chunk(
+    accepted: List[Tuple[int, Dict[str, object], List[str]]],
+    sets: Dict[str, List[str]],
+    set_deltas: Counter,
+) -> None:
+    user_ids = _insert_users([payload for _, payload, _ in accepted])
+    keyword_ids = ensure_keywords(name for _, _, keywords in accepted for name in keywords)
+    links = {
+        (user_ids[payload["telegram_id"]], keyword_ids[name])
+        for _, payload, keywords in accepted
+        for name in keywords
+    }
+    if links:
+        db.session.execute(
+            subs.insert(),
+            [{"users_id": user_id, "words_id": word_id} for user_id, word_id in links],
+        )
+        adjust_subscriber_counts(Counter(word_id for _, word_id in links))
+        apply_keyword_set_deltas(set_deltas, sets)
+    db.session.commit()
+
+
+def import_users(
+    rows: Iterable[Row], schema: Schema, chunk_size: int = IMPORT_CHUNK_SIZE
+) -> Dict[str, object]:
+    """Validate and insert users with their keywords, committing once per chunk.
+
+    A chunk that hits a unique constraint is rolled back and its rows are
+    reported in ``errors``; the following chunks are still imported.
+    """
+
+    imported = 0
+    errors: List[Dict[str, object]] = []
+    for chunk in _chunks(rows, chunk_size):
+        accepted = _validate_chunk(schema, chunk, errors)
+        if not accepted:
+            continue
+
+        sets: Dict[str, List[str]] = {}
+        set_deltas: Counter = Counter()
+        for _, payload, keywords in accepted:
+            fingerprint = payload["keyword_fingerprint"] = keyword_fingerprint(keywords)
+            if fingerprint:
+                sets[fingerprint] = sorted(set(keywords))
+                set_deltas[fingerprint] += 1
+        try:
+            _write_chunk(accepted, sets, set_deltas)
+        except IntegrityError:
+            # A concurrent registration took a telegram_id, phone or keyword
+            # after validation; drop this chunk and carry on with the next.
+            db.session.rollback()
+            errors.extend(
+                {"line": line_number, "errors": {"_schema": [CONFLICT_MESSAGE]}}
+                for line_number, _, _ in accepted
+            )
+            continue
+        imported += len(accepted)
+
+    errors.sort(key=lambda error: error["line"])
+    return {"imported": imported, "failed": len(errors), "errors": errors}
+
+
+def iter_export_rows(chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[Dict[str, object]]:
+    """Yield every user with their keywords, one primary-key page at a time."""
+
+    last_id = 0
+    while True:
+        users = Users.query.filter(Users.id > last_id).order_by(Users.id).limit(chunk_size).all()
+        if not users:
+            return
+        for user in users:
+            row = {
+                column: getattr(user, column) for column in EXPORT_COLUMNS if column != "keywords"
+            }
+            row["keywords"] = sorted(keyword.name for keyword in user.keywords)
+            yield row
+        last_id = users[-1].id
+        db.session.expunge_all()
+
+
+def _csv_value(value: object) -> object:
+    if isinstance(value, (dt.date, dt.datetime)):
+        return value.isoformat()
+    return value
+
+
+def export_ndjson(rows: Iterable[Dict[str, object]]) -> Iterator[str]:
+    for row in rows:
+        yield dumps(row, ensure_ascii=False) + "\n"
+
+
+def export_csv(rows: Iterable[Dict[str, object]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        row = dict(row, keywords=CSV_KEYWORD_SEPARATOR.join(row["keywords"]))
+        writer.writerow([_csv_value(row[column]) for column in EXPORT_COLUMNS])
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+__all__ = [
+    "ensure_keywords",
+    "export_csv",
+    "export_ndjson",
+    "import_users",
+    "iter_csv",
+    "iter_export_rows",
+    "iter_ndjson",
+]
@@ -0,0 +1,46 @@
+"""Maintenance commands exposed through ``flask --app app <command>``."""
+from __future__ import annotations
+
+import click
+
+from models.models import Users
+
+
+def register_commands(app) -> None:
+    @app.cli.command("backfill-trends")
+    @click.option("--telegram-id", default=None, help="Only rebuild rollups for this user.")
+    def backfill_trends(telegram_id):
+        """Rebuild mention trend rollups from stored search runs."""
+
+        from trends import backfill_rollups
+
+        user_id = None
+        if telegram_id:
+            user = Users.find_by_telegram_id(telegram_id)
+            if not user:
+                raise click.ClickException(f"User {telegram_id} not found")
+            user_id = user.id
+        written = backfill_rollups(user_id)
+        click.echo(f"Wrote {written} rollup rows")
+
+    @app.cli.command("gc-keywords")
+    @click.option("--batch-size", default=1000, show_default=True, help="Keywords deleted per transaction.")
+    def gc_keywords(batch_size):
+        """Delete keywords that no user subscribes to."""
+
+        from services import gc_orphan_keywords
+
+        removed = gc_orphan_keywords(batch_size)
+        click.echo(f"Removed {removed} orphaned keywords")
+
+    @app.cli.command("rebuild-keyword-stats")
+    def rebuild_keyword_stats_command():
+        """Recompute subscriber counts and keyword-set fingerprints from scratch."""
+
+        from keyword_stats import rebuild_keyword_stats
+
+        keywords, sets = rebuild_keyword_stats()
+        click.echo(f"Recounted {keywords} keywords and {sets} keyword sets")
+
+
+__all__ = ["register_commands"]
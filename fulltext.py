@@ -0,0 +1,153 @@
+"""Full-text search over stored mentions.
+
+Postgres matches against the ``russian`` text search configuration through the
+GIN expression index created with the ``mentions`` table. SQLite, used for
+local runs, has no Russian stemmer, so mention text is stemmed in Python with
+the same rules as the negative lexicon and stored in the ``mentions_fts`` FTS5
+table.
+
+Results are ordered newest first and paged with a keyset cursor on
+``(created_at, id)``, so deep pages cost the same as the first one.
+"""
+from __future__ import annotations
+
+import base64
+import datetime as dt
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from models.models import MENTION_TSVECTOR, Mention, Users, db, search_run_keywords
+from scoring import normalise_text, stem_word
+
+_WORD_RE = re.compile(r"\w+")
+
+Cursor = Tuple[dt.datetime, int]
+
+
+def stem_text(text: str) -> List[str]:
+    return [stem_word(word) for word in _WORD_RE.findall(normalise_text(text))]
+
+
+def _dialect() -> str:
+    return db.session.get_bind().dialect.name
+
+
+def index_run_mentions(run_id: int) -> None:
+    """Add the mentions of a search run to the SQLite FTS table; a no-op on Postgres."""
+
+    if _dialect() != "sqlite":
+        return
+    rows = db.session.execute(
+        db.select(Mention.id, Mention.headline, Mention.snippet).where(Mention.run_id == run_id)
+    )
+    entries = [
+        {"rowid": mention_id, "body": " ".join(stem_text(f"{headline or ''} {snippet or ''}"))}
+        for mention_id, headline, snippet in rows
+    ]
+    if entries:
+        db.session.execute(
+            db.text("INSERT INTO mentions_fts (rowid, body) VALUES (:rowid, :body)"), entries
+        )
+
+
+def unindex_user_mentions(user_ids: Sequence[int]) -> None:
+    """Drop the FTS entries of the given users' mentions; a no-op on Postgres."""
+
+    if _dialect() != "sqlite" or not user_ids:
+        return
+    mention_ids = db.select(Mention.id).where(Mention.user_id.in_(user_ids))
+    db.session.execute(
+        db.delete(db.table("mentions_fts", db.column("rowid"))).where(
+            db.column("rowid").in_(mention_ids)
+        )
+    )
+
+
+def encode_cursor(mention: Mention) -> str:
+    """Return an opaque cursor pointing just after ``mention``."""
+
+    raw = f"{mention.created_at.isoformat()}|{mention.id}"
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Parse a cursor produced by :func:`encode_cursor`; raise ``ValueError`` if invalid."""
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        created_at, mention_id = raw.split("|")
+        return dt.datetime.fromisoformat(created_at), int(mention_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def _match_clause(text: str):
+    if _dialect() == "postgresql":
+        return db.text(
+            f"{MENTION_TSVECTOR} @@ plainto_tsquery('russian', :fts_query)"
+        ).bindparams(fts_query=text)
+
+    terms = " ".join(f'"{term}"' for term in stem_text(text))
+    return Mention.id.in_(
+        db.select(db.column("rowid"))
+        .select_from(db.table("mentions_fts"))
+        .where(db.text("mentions_fts MATCH :fts_query").bindparams(fts_query=terms))
+    )
+
+
+def search_mentions(
+    text: str,
+    user_id: Optional[int] = None,
+    keyword: Optional[str] = None,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    cursor: Optional[Cursor] = None,
+    per_page: int = 20,
+) -> Tuple[List[Tuple[Mention, str]], Optional[str]]:
+    """Return a page of ``(mention, telegram_id)`` pairs and the cursor of the next page.
+
+    ``cursor`` is the decoded value returned for the previous page; the next
+    cursor is ``None`` on the last page.
+    """
+
+    if not stem_text(text):
+        return [], None
+
+    query = (
+        db.select(Mention, Users.telegram_id)
+        .join(Users, Users.id == Mention.user_id)
+        .where(_match_clause(text))
+    )
+    if user_id is not None:
+        query = query.where(Mention.user_id == user_id)
+    if keyword is not None:
+        query = query.where(
+            db.exists().where(
+                search_run_keywords.c.run_id == Mention.run_id,
+                search_run_keywords.c.keyword == keyword,
+            )
+        )
+    if since is not None:
+        query = query.where(Mention.created_at >= since)
+    if until is not None:
+        query = query.where(Mention.created_at < until)
+
+    if cursor is not None:
+        query = query.where(db.tuple_(Mention.created_at, Mention.id) < cursor)
+
+    query = query.order_by(Mention.created_at.desc(), Mention.id.desc()).limit(per_page + 1)
+    rows = [tuple(row) for row in db.session.execute(query)]
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, encode_cursor(rows[-1][0])
+
+
+__all__ = [
+    "decode_cursor",
+    "encode_cursor",
+    "index_run_mentions",
+    "search_mentions",
+    "stem_text",
+    "unindex_user_mentions",
+]
@@ -0,0 +1,210 @@
+"""Maintained keyword popularity counters.
+
+``KeyWords.subscriber_count`` holds the number of users following a keyword,
+``Users.keyword_fingerprint`` identifies a user's exact keyword set and
+``keyword_set_stats`` counts users per fingerprint. The counters change in the
+same transaction as the subscriptions, so reading the most popular keywords
+or sets is an index scan instead of an aggregate over ``subs``.
+"""
+from __future__ import annotations
+
+import hashlib
+from collections import Counter
+from itertools import groupby
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from models.models import KeyWords, KeywordSetStat, Users, db, subs, upsert
+
+REBUILD_CHUNK_SIZE = 1000
+
+
+def keyword_fingerprint(names: Iterable[str]) -> Optional[str]:
+    """Return the sha1 of the sorted, lower-cased names, or ``None`` for no keywords."""
+
+    names = sorted({name.lower() for name in names})
+    if not names:
+        return None
+    return hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()
+
+
+def adjust_subscriber_counts(deltas: Mapping[int, int]) -> None:
+    """Add ``deltas`` (keyword id -> change) to ``KeyWords.subscriber_count``."""
+
+    rows = [{"b_id": word_id, "b_delta": delta} for word_id, delta in deltas.items() if delta]
+    if not rows:
+        return
+    table = KeyWords.__table__
+    statement = (
+        table.update()
+        .where(table.c.id == db.bindparam("b_id"))
+        .values(subscriber_count=table.c.subscriber_count + db.bindparam("b_delta"))
+    )
+    db.session.execute(statement, rows)
+
+
+def _upsert_keyword_sets(rows: List[Dict[str, object]]) -> None:
+    upsert(
+        KeywordSetStat,
+        rows,
+        ["fingerprint"],
+        set_=lambda excluded: {"users": KeywordSetStat.__table__.c.users + excluded.users},
+    )
+
+
+def apply_keyword_set_deltas(
+    deltas: Mapping[str, int], keywords: Mapping[str, Sequence[str]]
+) -> None:
+    """Add ``deltas`` (fingerprint -> change) to the set counters.
+
+    ``keywords`` must name every set with a positive delta. Sets left without
+    users are removed.
+    """
+
+    table = KeywordSetStat.__table__
+    increments = [
+        {"fingerprint": fingerprint, "keywords": sorted(keywords[fingerprint]), "users": delta}
+        for fingerprint, delta in deltas.items()
+        if delta > 0
+    ]
+    decrements = [
+        {"b_fingerprint": fingerprint, "b_delta": delta}
+        for fingerprint, delta in deltas.items()
+        if delta < 0
+    ]
+
+    if increments:
+        _upsert_keyword_sets(increments)
+
+    if decrements:
+        db.session.execute(
+            table.update()
+            .where(table.c.fingerprint == db.bindparam("b_fingerprint"))
+            .values(users=table.c.users + db.bindparam("b_delta")),
+            decrements,
+        )
+        fingerprints = [row["b_fingerprint"] for row in decrements]
+        db.session.execute(
+            db.delete(KeywordSetStat)
+            .where(KeywordSetStat.fingerprint.in_(fingerprints), KeywordSetStat.users <= 0)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def update_user_fingerprint(user: Users) -> None:
+    """Recompute ``user.keyword_fingerprint`` and move the user between sets."""
+
+    names = [keyword.name for keyword in user.keywords]
+    new = keyword_fingerprint(names)
+    old = user.keyword_fingerprint
+    if new == old:
+        return
+    deltas: Counter = Counter()
+    if old:
+        deltas[old] -= 1
+    if new:
+        deltas[new] += 1
+    user.keyword_fingerprint = new
+    apply_keyword_set_deltas(deltas, {new: names} if new else {})
+
+
+def forget_users(user_ids: Sequence[int]) -> None:
+    """Take users that are about to be deleted out of every counter."""
+
+    word_counts = db.session.execute(
+        db.select(subs.c.words_id, db.func.count())
+        .where(subs.c.users_id.in_(user_ids))
+        .group_by(subs.c.words_id)
+    ).all()
+    adjust_subscriber_counts({word_id: -count for word_id, count in word_counts})
+
+    set_counts = db.session.execute(
+        db.select(Users.keyword_fingerprint, db.func.count())
+        .where(Users.id.in_(user_ids), Users.keyword_fingerprint.is_not(None))
+        .group_by(Users.keyword_fingerprint)
+    ).all()
+    apply_keyword_set_deltas({fingerprint: -count for fingerprint, count in set_counts}, {})
+
+
+def top_keywords(limit: int = 10) -> List[KeyWords]:
+    return (
+        KeyWords.query.filter(KeyWords.subscriber_count > 0)
+        .order_by(KeyWords.subscriber_count.desc(), KeyWords.name)
+        .limit(limit)
+        .all()
+    )
+
+
+def top_keyword_sets(limit: int = 10) -> List[KeywordSetStat]:
+    return (
+        KeywordSetStat.query.order_by(KeywordSetStat.users.desc(), KeywordSetStat.fingerprint)
+        .limit(limit)
+        .all()
+    )
+
+
+def rebuild_keyword_stats() -> Tuple[int, int]:
+    """Recompute every counter from ``subs``; return the keyword and set counts."""
+
+    keywords = KeyWords.__table__
+    db.session.execute(
+        keywords.update().values(
+            subscriber_count=db.select(db.func.count())
+            .where(subs.c.words_id == keywords.c.id)
+            .scalar_subquery()
+        )
+    )
+    db.session.execute(
+        db.update(Users)
+        .where(~db.exists().where(subs.c.users_id == Users.id))
+        .values(keyword_fingerprint=None)
+        .execution_options(synchronize_session=False)
+    )
+
+    pairs = db.session.execute(
+        db.select(subs.c.users_id, KeyWords.name)
+        .join(KeyWords, KeyWords.id == subs.c.words_id)
+        .order_by(subs.c.users_id)
+        .execution_options(yield_per=REBUILD_CHUNK_SIZE)
+    )
+    sets: Counter = Counter()
+    names_by_set: Dict[str, List[str]] = {}
+    updates: List[Dict[str, object]] = []
+    users = Users.__table__
+    set_fingerprint = (
+        users.update()
+        .where(users.c.id == db.bindparam("b_id"))
+        .values(keyword_fingerprint=db.bindparam("b_fingerprint"))
+    )
+    for user_id, rows in groupby(pairs, key=lambda row: row[0]):
+        names = sorted({name for _, name in rows})
+        fingerprint = keyword_fingerprint(names)
+        sets[fingerprint] += 1
+        names_by_set[fingerprint] = names
+        updates.append({"b_id": user_id, "b_fingerprint": fingerprint})
+        if len(updates) >= REBUILD_CHUNK_SIZE:
+            db.session.execute(set_fingerprint, updates)
+            updates = []
+    if updates:
+        db.session.execute(set_fingerprint, updates)
+
+    db.session.execute(db.delete(KeywordSetStat))
+    rows = [
+        {"fingerprint": fingerprint, "keywords": names_by_set[fingerprint], "users": count}
+        for fingerprint, count in sets.items()
+    ]
+    for offset in range(0, len(rows), REBUILD_CHUNK_SIZE):
+        db.session.execute(db.insert(KeywordSetStat), rows[offset : offset + REBUILD_CHUNK_SIZE])
+    db.session.commit()
+    return db.session.scalar(db.select(db.func.count()).select_from(KeyWords)), len(rows)
+
+
+__all__ = [
+    "adjust_subscriber_counts",
+    "apply_keyword_set_deltas",
+    "forget_users",
+    "keyword_fingerprint",
+    "rebuild_keyword_stats",
+    "top_keyword_sets",
+    "top_keywords",
+    "update_user_fingerprint",
+]
@@ -1,6 +1,4 @@
-import os, sys
 from aiogram import executor
-from bot_telegram.config import *
 from bot_telegram.loader import bot
 
 async def on_shutdown(dp):
@@ -2,17 +2,64 @@
 from __future__ import annotations
 
 import datetime as dt
-from typing import Dict, Iterable, List
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import Engine
 
 
 db = SQLAlchemy()
 
+
+@db.event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record) -> None:
+    """SQLite ignores ``ON DELETE CASCADE`` unless foreign keys are switched on."""
+
+    if type(dbapi_connection).__module__.startswith("sqlite3"):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+def upsert(
+    model,
+    rows: List[Dict[str, object]],
+    conflict_cols: Sequence[str],
+    set_: Optional[Callable[[Any], Dict[str, object]]] = None,
+) -> None:
+    """Insert ``rows`` into ``model`` with one ``INSERT ... ON CONFLICT`` statement.
+
+    Conflicting rows are skipped, or updated with ``set_(excluded)`` when
+    ``set_`` is given. Postgres and SQLite are the only deployed backends.
+    """
+
+    if not rows:
+        return
+    if db.session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(model).values(rows)
+    if set_ is None:
+        statement = statement.on_conflict_do_nothing(index_elements=list(conflict_cols))
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=list(conflict_cols), set_=set_(statement.excluded)
+        )
+    db.session.execute(statement)
+
+
 subs = db.Table(
     "subs",
-    db.Column("users_id", db.Integer, db.ForeignKey("users.id"), primary_key=True),
-    db.Column("words_id", db.Integer, db.ForeignKey("keywords.id"), primary_key=True),
+    db.Column(
+        "users_id", db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    ),
+    db.Column(
+        "words_id", db.Integer, db.ForeignKey("keywords.id", ondelete="CASCADE"), primary_key=True
+    ),
+    # The primary key covers lookups by user; keyword GC and cascades need this one.
+    db.Index("ix_subs_words_id", "words_id"),
 )
 
 
@@ -43,9 +90,11 @@ class Users(db.Model, TimestampMixin):
     link3 = db.Column(db.String(200), nullable=True)
     link4 = db.Column(db.String(200), nullable=True)
     link5 = db.Column(db.String(200), nullable=True)
+    # sha1 of the user's sorted keyword names, maintained by ``keyword_stats``.
+    keyword_fingerprint = db.Column(db.String(40), nullable=True, index=True)
 
     keywords = db.relationship(
-        "KeyWords", secondary=subs, back_populates="users", lazy="selectin"
+        "KeyWords", secondary=subs, back_populates="users", lazy="selectin", passive_deletes=True
     )
 
     def save(self) -> None:
@@ -56,7 +105,7 @@ class Users(db.Model, TimestampMixin):
     def find_by_telegram_id(cls, telegram_id: str) -> "Users | None":
         return cls.query.filter_by(telegram_id=str(telegram_id)).first()
 
-    def to_dict(self) -> Dict[str, str]:
+    def to_dict(self) -> Dict[str, object]:
         return {
             "id": self.id,
             "name": self.name,
@@ -65,8 +114,8 @@ class Users(db.Model, TimestampMixin):
             "telegram_id": self.telegram_id,
             "phone": self.phone,
             "city": self.city,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
         }
 
 
@@ -75,9 +124,11 @@ class KeyWords(db.Model, TimestampMixin):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False, unique=True)
+    subscriber_count = db.Column(db.Integer, nullable=False, default=0, server_default="0", index=True)
 
+    # Loaded only on access: popular keywords have many subscribers.
     users = db.relationship(
-        "Users", secondary=subs, back_populates="keywords", lazy="selectin"
+        "Users", secondary=subs, back_populates="keywords", lazy="select", passive_deletes=True
     )
 
     def save(self) -> None:
@@ -88,10 +139,187 @@ class KeyWords(db.Model, TimestampMixin):
     def get_word_by_name(cls, name: str) -> "KeyWords | None":
         return cls.query.filter(db.func.lower(cls.name) == name.lower()).first()
 
-    def to_dict(self) -> Dict[str, str]:
+    def to_dict(self) -> Dict[str, object]:
         return {
             "id": self.id,
             "name": self.name,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class SeenUrl(db.Model):
+    """Hashed canonical URLs already reported to a user."""
+
+    __tablename__ = "seen_urls"
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    url_hash = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    first_seen_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
+
+
+class RankPosition(db.Model):
+    """Rank of one of the user's own links in a search result set."""
+
+    __tablename__ = "rank_positions"
+    __table_args__ = (db.Index("ix_rank_positions_user_checked", "user_id", "checked_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    region = db.Column(db.String(30), nullable=True)
+    link = db.Column(db.String(200), nullable=False)
+    position = db.Column(db.Integer, nullable=True)
+    best_negative_position = db.Column(db.Integer, nullable=True)
+    checked_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
+
+    def to_dict(self) -> Dict[str, object]:
+        margin = None
+        if self.position is not None and self.best_negative_position is not None:
+            margin = self.best_negative_position - self.position
+        return {
+            "region": self.region,
+            "link": self.link,
+            "position": self.position,
+            "best_negative_position": self.best_negative_position,
+            "margin": margin,
+            "checked_at": self.checked_at,
+        }
+
+
+search_run_keywords = db.Table(
+    "search_run_keywords",
+    db.Column(
+        "run_id",
+        db.Integer,
+        db.ForeignKey("search_runs.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    db.Column("keyword", db.String(50), primary_key=True),
+)
+
+
+class SearchRun(db.Model):
+    """A single upstream search executed on behalf of a user."""
+
+    __tablename__ = "search_runs"
+    __table_args__ = (db.Index("ix_search_runs_user_created", "user_id", "created_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    # Named ``search_query`` so that it does not hide ``Model.query``.
+    search_query = db.Column("query", db.String(255), nullable=False)
+    region = db.Column(db.String(30), nullable=True)
+    result_count = db.Column(db.Integer, nullable=False, default=0)
+    negative_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
+
+
+class Mention(db.Model):
+    """A search result stored with the run that produced it."""
+
+    __tablename__ = "mentions"
+    __table_args__ = (
+        db.Index("ix_mentions_user_created", "user_id", "created_at"),
+        db.Index("ix_mentions_created", "created_at", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(
+        db.Integer, db.ForeignKey("search_runs.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    position = db.Column(db.Integer, nullable=True)
+    url = db.Column(db.Text, nullable=True)
+    canonical_url = db.Column(db.Text, nullable=True)
+    headline = db.Column(db.Text, nullable=True)
+    snippet = db.Column(db.Text, nullable=True)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    matched_terms = db.Column(db.JSON, nullable=True)
+    is_new = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "id": self.id,
+            "url": self.url,
+            "canonical_url": self.canonical_url,
+            "headline": self.headline,
+            "snippet": self.snippet,
+            "score": self.score,
+            "matched_terms": self.matched_terms or [],
+            "created_at": self.created_at,
+        }
+
+
+# Full-text index over mention headlines and snippets. Postgres indexes the
+# expression below with GIN; SQLite keeps Python-stemmed text in an FTS5 table
+# maintained by ``fulltext.index_run_mentions``.
+MENTION_TSVECTOR = (
+    "to_tsvector('russian', coalesce(headline, '') || ' ' || coalesce(snippet, ''))"
+)
+
+db.event.listen(
+    Mention.__table__,
+    "after_create",
+    db.DDL(
+        f"CREATE INDEX IF NOT EXISTS ix_mentions_fts ON mentions USING GIN ({MENTION_TSVECTOR})"
+    ).execute_if(dialect="postgresql"),
+)
+db.event.listen(
+    Mention.__table__,
+    "after_create",
+    db.DDL(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS mentions_fts USING fts5(body, tokenize='unicode61')"
+    ).execute_if(dialect="sqlite"),
+)
+db.event.listen(
+    Mention.__table__,
+    "after_drop",
+    db.DDL("DROP TABLE IF EXISTS mentions_fts").execute_if(dialect="sqlite"),
+)
+
+
+class MentionRollup(db.Model):
+    """New negative mentions per user, keyword and time bucket."""
+
+    __tablename__ = "mention_rollups"
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    period = db.Column(db.String(5), primary_key=True)
+    keyword = db.Column(db.String(50), primary_key=True)
+    bucket = db.Column(db.Date(), primary_key=True)
+    mentions = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "keyword": self.keyword,
+            "bucket": self.bucket,
+            "mentions": self.mentions,
+        }
+
+
+class KeywordSetStat(db.Model):
+    """Number of users subscribed to exactly this set of keywords."""
+
+    __tablename__ = "keyword_set_stats"
+
+    fingerprint = db.Column(db.String(40), primary_key=True)
+    keywords = db.Column(db.JSON, nullable=False)
+    users = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "fingerprint": self.fingerprint,
+            "keywords": self.keywords,
+            "users": self.users,
         }
@@ -1,25 +1,56 @@
-"""PDF report generation helpers."""
+"""PDF report generation helpers.
+
+reportlab is imported on first use so that processes which never render a
+report do not pay for it at startup.
+"""
 from __future__ import annotations
 
 from pathlib import Path
 from typing import Iterable, Mapping
 
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from metrics import CACHE_HITS, CACHE_MISSES, time_stage
 
 FONT_NAME = "FreeSans"
 FONT_PATH = Path("FreeSans.ttf")
 REPORTS_DIR = Path("reports")
 
 
+def _register_font() -> None:
+    """Parse and register the report font once per process."""
+
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        CACHE_HITS.inc(cache="pdf_font")
+        return
+    CACHE_MISSES.inc(cache="pdf_font")
+    with time_stage("pdf.register_font"):
+        pdfmetrics.registerFont(TTFont(FONT_NAME, str(FONT_PATH)))
+
+
 def generate_pdf_report(user, results: Iterable[Mapping[str, str]]) -> str:
     """Generate a PDF report for the provided search results."""
 
+    with time_stage("pdf.total"):
+        return _render_report(user, results)
+
+
+def warm_up() -> None:
+    """Import reportlab and register the font ahead of the first report."""
+
+    with time_stage("pdf.warm_up"):
+        _register_font()
+        import reportlab.pdfgen.canvas  # noqa: F401
+
+
+def _render_report(user, results: Iterable[Mapping[str, str]]) -> str:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-    pdfmetrics.registerFont(TTFont(FONT_NAME, str(FONT_PATH)))
+    _register_font()
 
     filename = f"{user.name}_{user.surname}_{user.telegram_id}.pdf"
     output_path = REPORTS_DIR / filename
@@ -47,7 +78,8 @@ def generate_pdf_report(user, results: Iterable[Mapping[str, str]]) -> str:
             pdf.setFont(FONT_NAME, 12)
             y_position = 780
 
-    pdf.save()
+    with time_stage("pdf.save"):
+        pdf.save()
     return str(output_path)
 
 
@@ -68,4 +100,4 @@ def _wrap_text(text: str, width: int) -> list[str]:
     return lines
 
 
-__all__ = ["generate_pdf_report"]
+__all__ = ["generate_pdf_report", "warm_up"]
@@ -0,0 +1,156 @@
+"""Opt-in cProfile capture for individual ``/api`` requests.
+
+A request is profiled when it carries ``X-Profile: <PROFILE_TOKEN>`` or when it
+is picked by ``PROFILE_SAMPLE_RATE``. The stats are written to
+``PROFILES_DIR/<profile id>.pstats`` (see ``_request_id``) and the response
+carries ``X-Profile-Id`` and ``X-Profile-Url`` headers. With neither setting configured no hooks are
+installed at all.
+"""
+from __future__ import annotations
+
+import cProfile
+import datetime as dt
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from flask import Flask, current_app, g, request
+
+PROFILE_HEADER = "X-Profile"
+REQUEST_ID_HEADER = "X-Request-Id"
+PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,48}$")
+
+
+def _profiles_dir(app: Flask) -> Path:
+    return Path(app.config["PROFILES_DIR"])
+
+
+def is_authorised(token: Optional[str]) -> bool:
+    expected = current_app.config.get("PROFILE_TOKEN")
+    if not expected or token is None:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+
+
+def _should_profile(app: Flask) -> bool:
+    if not request.path.startswith("/api/") or request.path.startswith("/api/profiles"):
+        return False
+    if is_authorised(request.headers.get(PROFILE_HEADER)):
+        return True
+    rate = app.config["PROFILE_SAMPLE_RATE"]
+    return rate > 0 and random.random() < rate
+
+
+def _request_id() -> str:
+    """Return the profile id: ``<X-Request-Id>-<12 hex chars>``, or a 32-char uuid4 hex.
+
+    The client id is used only when it matches ``REQUEST_ID_RE``; the random
+    suffix keeps ids unique, so a client cannot pick or overwrite a profile.
+    """
+
+    suffix = uuid.uuid4().hex
+    candidate = request.headers.get(REQUEST_ID_HEADER, "")
+    return f"{candidate}-{suffix[:12]}" if REQUEST_ID_RE.match(candidate) else suffix
+
+
+def _prune(directory: Path, keep: int) -> None:
+    if keep <= 0:
+        return
+    stats_files = sorted(directory.glob("*.pstats"), key=lambda path: path.stat().st_mtime)
+    for path in stats_files[:-keep]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".json").unlink(missing_ok=True)
+
+
+def register_profiling(app: Flask) -> None:
+    """Install the profiling hooks when a token or sample rate is configured."""
+
+    app.config.setdefault("PROFILE_TOKEN", os.getenv("PROFILE_TOKEN"))
+    app.config.setdefault("PROFILE_SAMPLE_RATE", float(os.getenv("PROFILE_SAMPLE_RATE", "0")))
+    app.config.setdefault("PROFILES_DIR", os.getenv("PROFILES_DIR", "profiles"))
+    app.config.setdefault("PROFILES_KEEP", int(os.getenv("PROFILES_KEEP", "200")))
+    if not app.config["PROFILE_TOKEN"] and not app.config["PROFILE_SAMPLE_RATE"]:
+        return
+
+    @app.before_request
+    def start_profiler():
+        if not _should_profile(app):
+            return
+        g.profile_id = _request_id()
+        g.profile_started = time.perf_counter()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.after_request
+    def save_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        profiler.disable()
+
+        directory = _profiles_dir(app)
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(directory / f"{g.profile_id}.pstats"))
+        metadata = {
+            "id": g.profile_id,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - g.profile_started) * 1000, 3),
+            "created_at": dt.datetime.utcnow().isoformat() + "Z",
+        }
+        (directory / f"{g.profile_id}.json").write_text(json.dumps(metadata), encoding="utf-8")
+        _prune(directory, app.config["PROFILES_KEEP"])
+
+        response.headers["X-Profile-Id"] = g.profile_id
+        response.headers["X-Profile-Url"] = f"/api/profiles/{g.profile_id}"
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+
+
+def list_profiles(limit: int = 50) -> List[Dict[str, object]]:
+    directory = _profiles_dir(current_app)
+    if not directory.is_dir():
+        return []
+    sidecars = sorted(directory.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+    return [json.loads(path.read_text(encoding="utf-8")) for path in sidecars[:limit]]
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = _profiles_dir(current_app) / f"{profile_id}.pstats"
+    return path if path.is_file() else None
+
+
+def render_profile_text(path: Path, limit: int = 60) -> str:
+    """Return the cumulative-time summary of a stored profile."""
+
+    buffer = io.StringIO()
+    stats = pstats.Stats(str(path), stream=buffer)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return buffer.getvalue()
+
+
+__all__ = [
+    "PROFILE_HEADER",
+    "is_authorised",
+    "list_profiles",
+    "profile_path",
+    "register_profiling",
+    "render_profile_text",
+]
@@ -0,0 +1,246 @@
+"""Negative-mention scoring for search results.
+
+Results are matched against a lexicon of negative terms with a single
+Aho-Corasick pass over the headline and snippet. Every word of a lexicon term
+is reduced to a crude Russian stem so that inflected forms ("взятка",
+"взятку", "уголовного дела") hit the same entry. Terms whose stem starts
+unrelated common words ("задержка", "изменение", "сливочное") are matched as
+whole word forms instead.
+"""
+from __future__ import annotations
+
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, MutableMapping, Sequence, Tuple
+
+# Mirrors the negative keyword buttons offered by the Telegram bot
+# (``bot_telegram/keyboards/choise_buttons.py``) plus common synonyms. Values
+# are severity weights.
+NEGATIVE_LEXICON: Dict[str, float] = {
+    "Коррупция": 3.0,
+    "Взятка": 3.0,
+    "Шантаж": 3.0,
+    "Вымогательство": 3.0,
+    "Воровство": 3.0,
+    "Хищение": 3.0,
+    "Мошенник": 3.0,
+    "Мошенничество": 3.0,
+    "Задержан": 3.0,
+    "Арестован": 3.0,
+    "Уголовное дело": 3.0,
+    "Подозревается": 2.0,
+    "Обвиняется": 2.0,
+    "Расследование": 2.0,
+    "Скандал": 2.0,
+    "Слив": 2.0,
+    "Компромат": 2.0,
+    "Измена": 1.0,
+    "Интим": 1.0,
+    "Спам": 1.0,
+}
+
+# Terms whose stem starts many unrelated words ("задерживается", "изменение",
+# "сливочное") only match these exact forms.
+WHOLE_WORD_FORMS: Dict[str, Tuple[str, ...]] = {
+    "Задержан": (
+        "задержан", "задержана", "задержано", "задержаны",
+        "задержание", "задержания", "задержанию", "задержанием", "задержании",
+        "задержаний", "задержаниям", "задержаниями", "задержаниях",
+        "задержанный", "задержанная", "задержанное", "задержанные",
+        "задержанного", "задержанной", "задержанному", "задержанную",
+        "задержанным", "задержанных", "задержанными",
+    ),
+    "Измена": (
+        "измена", "измены", "измене", "измену", "изменой", "изменою",
+        "измен", "изменам", "изменами", "изменах",
+    ),
+    # Plural forms are left out: "сливы" are usually plums.
+    "Слив": ("слив", "слива", "сливу", "сливе", "сливом", "сливов"),
+}
+
+HEADLINE_WEIGHT = 2.0
+MIN_STEM_LENGTH = 4
+# Words of a multi-word term may be stemmed further: the other words keep the
+# match specific ("уголовного дела" -> "уголовн дел").
+PHRASE_MIN_STEM_LENGTH = 3
+
+_WORD_RE = re.compile(r"\w+")
+
+# Inflectional endings stripped from lexicon terms, longest first.
+_ENDINGS = tuple(
+    sorted(
+        {
+            "ается", "яется", "ется", "ится", "ются", "ятся", "ание", "ение",
+            "ость", "ости", "иями", "ями", "ами", "ией", "ого", "его", "ему",
+            "ому", "ыми", "ими", "ство", "ия", "ие", "ий", "ья", "ье", "ьи",
+            "ей", "ой", "ый", "ая", "яя", "ое", "ее", "ые", "ах", "ях", "ам",
+            "ям", "ом", "ем", "ов", "ев", "ую", "юю", "ть", "ла", "ло", "ли",
+            "ан", "ен", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+        },
+        key=len,
+        reverse=True,
+    )
+)
+
+
+def normalise_text(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def stem_word(word: str, min_length: int = MIN_STEM_LENGTH) -> str:
+    """Strip a single inflectional ending, keeping at least ``min_length`` chars."""
+
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= min_length:
+            return word[: -len(ending)]
+    return word
+
+
+def stem_term(term: str) -> str:
+    """Return the pattern used for ``term``, with every word stemmed."""
+
+    words = normalise_text(term).split()
+    min_length = PHRASE_MIN_STEM_LENGTH if len(words) > 1 else MIN_STEM_LENGTH
+    return " ".join(stem_word(word, min_length) for word in words)
+
+
+class NegativeLexicon:
+    """Aho-Corasick automaton over the first word stem of each lexicon term.
+
+    A hit on the first stem is confirmed against the following words of the
+    text or, for whole-word terms, against the full word.
+    """
+
+    def __init__(
+        self,
+        terms: Mapping[str, float],
+        whole_word_forms: Mapping[str, Sequence[str]] = WHOLE_WORD_FORMS,
+    ):
+        self.weights: Dict[str, float] = {}
+        self._forms = {term: set(forms) for term, forms in whole_word_forms.items()}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, int, Tuple[str, ...]]]] = [[]]
+
+        for term, weight in terms.items():
+            if term in self._forms:
+                patterns = [(form,) for form in sorted(self._forms[term])]
+            else:
+                patterns = [tuple(stem_term(term).split())]
+            patterns = [stems for stems in patterns if stems]
+            if not patterns:
+                continue
+            self.weights[term] = float(weight)
+            for stems in patterns:
+                self._add_pattern(stems, term)
+        self._build_failure_links()
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    def _add_pattern(self, stems: Tuple[str, ...], term: str) -> None:
+        state = 0
+        for char in stems[0]:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((term, len(stems[0]), stems))
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+
+    def _confirm(self, term: str, stems: Tuple[str, ...], words: List[str]) -> bool:
+        if len(words) < len(stems):
+            return False
+        if term in self._forms:
+            # The form must be the whole word, not just a prefix of another form.
+            return words[0] == stems[0]
+        return all(word.startswith(stem) for stem, word in zip(stems[1:], words[1:]))
+
+    def scan(self, text: str) -> List[Tuple[str, str]]:
+        """Return ``(term, surface form)`` pairs for every word-initial match in ``text``."""
+
+        text = normalise_text(text)
+        spans = [(match.start(), match.group()) for match in _WORD_RE.finditer(text)]
+        word_at = {start: position for position, (start, _) in enumerate(spans)}
+        words = [word for _, word in spans]
+        goto, fail, output = self._goto, self._fail, self._output
+        matches: List[Tuple[str, str]] = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+            for term, length, stems in output[state]:
+                position = word_at.get(index - length + 1)
+                if position is None:
+                    continue
+                candidate = words[position : position + len(stems)]
+                if self._confirm(term, stems, candidate):
+                    matches.append((term, " ".join(candidate)))
+        return matches
+
+
+@lru_cache(maxsize=1)
+def default_lexicon() -> NegativeLexicon:
+    return NegativeLexicon(NEGATIVE_LEXICON)
+
+
+def score_result(
+    result: MutableMapping[str, object], lexicon: NegativeLexicon | None = None
+) -> MutableMapping[str, object]:
+    """Annotate a single result with ``score`` and ``matched_terms``."""
+
+    if lexicon is None:
+        lexicon = default_lexicon()
+    matched: Dict[str, float] = {}
+    for field, factor in (("headline", HEADLINE_WEIGHT), ("snippet", 1.0)):
+        for term, _surface in lexicon.scan(str(result.get(field) or "")):
+            matched[term] = matched.get(term, 0.0) + lexicon.weights[term] * factor
+
+    result["score"] = round(sum(matched.values(), 0.0), 2)
+    result["matched_terms"] = sorted(matched)
+    return result
+
+
+def score_results(
+    results: Iterable[MutableMapping[str, object]],
+    lexicon: NegativeLexicon | None = None,
+) -> List[MutableMapping[str, object]]:
+    """Score every result and order them by severity, keeping provider order on ties."""
+
+    if lexicon is None:
+        lexicon = default_lexicon()
+    scored = [score_result(result, lexicon) for result in results]
+    scored.sort(key=lambda item: -float(item["score"]))
+    return scored
+
+
+__all__ = [
+    "NEGATIVE_LEXICON",
+    "NegativeLexicon",
+    "WHOLE_WORD_FORMS",
+    "default_lexicon",
+    "score_result",
+    "score_results",
+    "stem_term",
+    "stem_word",
+]
@@ -1,14 +1,49 @@
 """Service layer helpers used by the REST API."""
 from __future__ import annotations
 
-from typing import Iterable, List
-
+import copy
+import datetime as dt
 import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from requests.exceptions import HTTPError, RequestException
+
+from models.models import (
+    KeyWords,
+    Mention,
+    RankPosition,
+    SearchRun,
+    SeenUrl,
+    Users,
+    db,
+    search_run_keywords,
+    subs,
+    upsert,
+)
+from fulltext import index_run_mentions, unindex_user_mentions
+from keyword_stats import adjust_subscriber_counts, forget_users, update_user_fingerprint
+from metrics import CACHE_HITS, CACHE_MISSES, UPSTREAM_ERRORS, time_stage
+from scoring import score_results
+from trends import apply_rollup_deltas, mention_rollup_deltas
+from urlcanon import canonicalise_url, url_hash
+from xmlproxy import get_urls, region_id_for_city
+
+# Upper bound on concurrent provider calls across the whole process, shared by
+# single, regional and batch searches.
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "4"))
+PROVIDER_SLOTS = threading.BoundedSemaphore(SEARCH_CONCURRENCY)
+# Seconds a search waits for a provider slot before giving up with ``ProviderBusy``.
+SEARCH_SLOT_TIMEOUT = float(os.getenv("SEARCH_SLOT_TIMEOUT", "30"))
+
+# Rows removed per statement by ``gc_orphan_keywords``.
+KEYWORD_GC_BATCH_SIZE = 1000
 
-from requests.exceptions import HTTPError
 
-from models.models import KeyWords, Users, db
-from xmlproxy import get_urls
+class ProviderBusy(RequestException):
+    """Raised when no provider slot frees up within ``SEARCH_SLOT_TIMEOUT``."""
 
 
 def normalise_keyword(name: str) -> str:
@@ -21,7 +56,9 @@ def get_or_create_keyword(name: str) -> KeyWords:
         return keyword
     keyword = KeyWords(name=name)
     db.session.add(keyword)
-    db.session.commit()
+    # Flush, not commit: the caller updates subscriptions and counters in the
+    # same transaction.
+    db.session.flush()
     return keyword
 
 
@@ -35,37 +72,131 @@ def add_keywords_to_user(user: Users, keywords: Iterable[str]) -> List[KeyWords]
         if keyword not in user.keywords:
             user.keywords.append(keyword)
             added.append(keyword)
+    if added:
+        adjust_subscriber_counts({keyword.id: 1 for keyword in added})
+        update_user_fingerprint(user)
     db.session.commit()
     return added
 
 
 def delete_user_keywords(user: Users, keywords: Iterable[str]) -> List[str]:
-    removed: List[str] = []
+    removed: List[KeyWords] = []
     for raw_name in keywords:
         name = normalise_keyword(raw_name)
         keyword = KeyWords.get_word_by_name(name)
         if keyword and keyword in user.keywords:
             user.keywords.remove(keyword)
-            removed.append(keyword.name)
+            removed.append(keyword)
+    if removed:
+        adjust_subscriber_counts({keyword.id: -1 for keyword in removed})
+        update_user_fingerprint(user)
+    db.session.commit()
+    return [keyword.name for keyword in removed]
+
+
+def delete_users(user_ids: Sequence[int]) -> int:
+    """Delete users with set-based statements and return how many were removed.
+
+    Keyword links are removed with one statement against ``subs``; search runs,
+    mentions, rankings, rollups and seen URLs go through ``ON DELETE CASCADE``.
+    """
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    forget_users(user_ids)
+    unindex_user_mentions(user_ids)
+    db.session.execute(subs.delete().where(subs.c.users_id.in_(user_ids)))
+    deleted = db.session.execute(
+        db.delete(Users).where(Users.id.in_(user_ids)).execution_options(synchronize_session=False)
+    ).rowcount
     db.session.commit()
-    return removed
+    return deleted
+
+
+def gc_orphan_keywords(batch_size: int = KEYWORD_GC_BATCH_SIZE) -> int:
+    """Delete keywords no user subscribes to, one batch per transaction."""
+
+    orphaned = ~db.exists().where(subs.c.words_id == KeyWords.id)
+    removed = 0
+    while True:
+        batch = db.session.scalars(
+            db.select(KeyWords.id).where(orphaned).order_by(KeyWords.id).limit(batch_size)
+        ).all()
+        if not batch:
+            return removed
+        # Re-check inside the DELETE so a keyword subscribed meanwhile survives.
+        removed += db.session.execute(
+            db.delete(KeyWords)
+            .where(KeyWords.id.in_(batch), orphaned)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if len(batch) < batch_size:
+            return removed
 
 
 def get_keywords_for_user(user: Users) -> List[str]:
     return sorted(keyword.name for keyword in user.keywords)
 
 
-def perform_search(query: str, keywords: Iterable[str]) -> List[dict]:
-    """Perform the XMLProxy search and return structured results."""
+def build_user_query(user: Users) -> str:
+    return " ".join(filter(None, [user.name, user.surname, user.patronymic or ""]))
+
+
+def get_user_regions(user: Users) -> List[str]:
+    """Return the user's distinct cities in registration order."""
+
+    regions: List[str] = []
+    for city in (user.city, user.city2, user.city3):
+        if city and city.strip() and city.strip() not in regions:
+            regions.append(city.strip())
+    return regions
+
+
+def get_user_links(user: Users) -> List[str]:
+    return [link for link in (user.link, user.link2, user.link3, user.link4, user.link5) if link]
+
+
+def perform_search(
+    query: str, keywords: Iterable[str], region: Optional[str] = None
+) -> List[dict]:
+    """Perform the XMLProxy search and return results ordered by negative score.
+
+    When ``region`` is a city with a known Yandex region code the search is
+    restricted to it, otherwise the city name is appended to the query.
+    Raises :class:`ProviderBusy` when no provider slot frees up in time.
+    """
 
     joined_keywords = ",".join(sorted({normalise_keyword(name) for name in keywords}))
-    response_text = get_urls(query=f"{query} {joined_keywords}")
+    search_query = f"{query} {joined_keywords}"
+    region_id = region_id_for_city(region) if region else None
+    if region and region_id is None:
+        search_query = f"{search_query} {region}"
+    with time_stage("perform_search.wait_slot"):
+        if not PROVIDER_SLOTS.acquire(timeout=SEARCH_SLOT_TIMEOUT):
+            UPSTREAM_ERRORS.inc(reason="slot_timeout")
+            raise ProviderBusy(
+                f"All {SEARCH_CONCURRENCY} provider slots stayed busy for {SEARCH_SLOT_TIMEOUT:g}s"
+            )
+    try:
+        with time_stage("perform_search.fetch"):
+            response_text = get_urls(query=search_query, region=region_id)
+    finally:
+        PROVIDER_SLOTS.release()
+    with time_stage("perform_search.shape"):
+        results = _shape_results(response_text, joined_keywords)
+    with time_stage("perform_search.score"):
+        return score_results(collapse_duplicates(results))
 
+
+def _shape_results(response_text: str, joined_keywords: str) -> List[dict]:
     results: List[dict] = []
     try:
         data = json.loads(response_text)
         groups = data["yandexsearch"]["response"]["results"]["grouping"].get("group", [])
     except (KeyError, ValueError, TypeError) as exc:  # pragma: no cover - defensive
+        UPSTREAM_ERRORS.inc(reason="bad_response")
         raise HTTPError(f"Unexpected response from search provider: {exc}") from exc
 
     for index, group in enumerate(groups, start=1):
@@ -97,6 +228,272 @@ def perform_search(query: str, keywords: Iterable[str]) -> List[dict]:
     return results
 
 
+def perform_regional_search(
+    query: str, keywords: Iterable[str], regions: Sequence[Optional[str]]
+) -> Dict[Optional[str], List[dict]]:
+    """Run one search per region concurrently and return results keyed by region."""
+
+    keywords = list(keywords)
+    regions = list(dict.fromkeys(regions))
+    if len(regions) <= 1:
+        return {region: perform_search(query, keywords, region) for region in regions}
+
+    with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+        futures = {
+            region: pool.submit(perform_search, query, keywords, region) for region in regions
+        }
+        return {region: future.result() for region, future in futures.items()}
+
+
+def load_users_with_keywords(telegram_ids: Iterable[str]) -> List[Users]:
+    """Load users and their keywords with a single joined query."""
+
+    telegram_ids = [str(telegram_id) for telegram_id in telegram_ids]
+    return (
+        Users.query.options(db.joinedload(Users.keywords))
+        .filter(Users.telegram_id.in_(telegram_ids))
+        .all()
+    )
+
+
+def iter_batch_searches(
+    users: Iterable[Users], max_workers: int = SEARCH_CONCURRENCY
+) -> Iterator[Tuple[Users, str, List[str], Optional[List[dict]], Optional[RequestException]]]:
+    """Run one upstream search per distinct query and yield per-user outcomes as they finish.
+
+    Users whose name and keywords produce the same query share a single
+    provider call; each of them receives its own copy of the results. Provider
+    failures, including timeouts and connection errors, are yielded as the
+    error of every affected user.
+    """
+
+    groups: Dict[Tuple[str, Tuple[str, ...]], List[Users]] = {}
+    for user in users:
+        keywords = tuple(get_keywords_for_user(user))
+        groups.setdefault((build_user_query(user), keywords), []).append(user)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups) or 1)))
+    try:
+        futures = {
+            pool.submit(perform_search, query, keywords): (query, keywords)
+            for query, keywords in groups
+            if keywords
+        }
+        for query, keywords in groups:
+            if not keywords:
+                for user in groups[(query, keywords)]:
+                    yield user, query, [], None, None
+
+        for future in as_completed(futures):
+            query, keywords = futures[future]
+            try:
+                results, error = future.result(), None
+            except RequestException as exc:
+                results, error = None, exc
+            group = groups[(query, keywords)]
+            for user in group:
+                shared = results if len(group) == 1 else copy.deepcopy(results)
+                yield user, query, list(keywords), shared, error
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def collapse_duplicates(results: Iterable[dict]) -> List[dict]:
+    """Merge results pointing at the same canonical URL, keeping the best-ranked one."""
+
+    unique: Dict[object, dict] = {}
+    for result in results:
+        canonical = canonicalise_url(result.get("url"))
+        # Results without a URL have nothing in common; keep each of them.
+        key = canonical or ("id", result.get("id"))
+        existing = unique.get(key)
+        if existing is None:
+            result["canonical_url"] = canonical
+            result.setdefault("aliases", [])
+            unique[key] = result
+            continue
+        for alias in [result.get("url"), *result.get("aliases", [])]:
+            if alias and alias != existing.get("url") and alias not in existing["aliases"]:
+                existing["aliases"].append(alias)
+    return list(unique.values())
+
+
+def mark_seen_urls(user: Users, results: Iterable[dict]) -> List[dict]:
+    """Flag results the user has not been shown before and remember them.
+
+    The caller is responsible for committing the session.
+    """
+
+    results = list(results)
+    by_hash: Dict[int, List[dict]] = {}
+    for result in results:
+        if not result["canonical_url"]:
+            result["is_new"] = True
+            continue
+        by_hash.setdefault(url_hash(result["canonical_url"]), []).append(result)
+    if not by_hash:
+        return results
+
+    seen = {
+        row.url_hash
+        for row in db.session.query(SeenUrl.url_hash).filter(
+            SeenUrl.user_id == user.id, SeenUrl.url_hash.in_(list(by_hash))
+        )
+    }
+    for hashed, group in by_hash.items():
+        for result in group:
+            result["is_new"] = hashed not in seen
+    CACHE_HITS.inc(len(seen), cache="seen_urls")
+    CACHE_MISSES.inc(len(by_hash) - len(seen), cache="seen_urls")
+
+    new_rows = [
+        {"user_id": user.id, "url_hash": hashed} for hashed in by_hash if hashed not in seen
+    ]
+    if new_rows:
+        _insert_seen_urls(new_rows)
+    return results
+
+
+def _insert_seen_urls(rows: List[Dict[str, int]]) -> None:
+    """Insert ``rows``, skipping URLs an overlapping search stored meanwhile."""
+
+    upsert(SeenUrl, rows, ["user_id", "url_hash"])
+
+
+def find_own_link_positions(user: Users, results: Iterable[dict]) -> Dict[str, Optional[int]]:
+    """Return the provider rank of each of the user's own links, ``None`` when absent."""
+
+    links_by_url = {canonicalise_url(link): link for link in get_user_links(user)}
+    positions: Dict[str, Optional[int]] = {link: None for link in links_by_url.values()}
+    for result in results:
+        link = links_by_url.get(result["canonical_url"])
+        if link is None:
+            continue
+        current = positions[link]
+        if current is None or result["id"] < current:
+            positions[link] = result["id"]
+    return positions
+
+
+def record_rank_positions(
+    user: Users, results: Iterable[dict], region: Optional[str] = None
+) -> Dict[str, Optional[int]]:
+    """Store where the user's links and the first negative mention ranked.
+
+    The caller is responsible for committing the session.
+    """
+
+    results = list(results)
+    positions = find_own_link_positions(user, results)
+    if not positions:
+        return positions
+
+    negative_positions = [result["id"] for result in results if result.get("score")]
+    best_negative = min(negative_positions) if negative_positions else None
+    db.session.execute(
+        db.insert(RankPosition),
+        [
+            {
+                "user_id": user.id,
+                "region": region,
+                "link": link,
+                "position": position,
+                "best_negative_position": best_negative,
+            }
+            for link, position in positions.items()
+        ],
+    )
+    return positions
+
+
+def record_search_run(
+    user: Users,
+    query: str,
+    keywords: Iterable[str],
+    results: Iterable[dict],
+    region: Optional[str] = None,
+    created_at: Optional[dt.datetime] = None,
+) -> SearchRun:
+    """Store a search run with its mentions.
+
+    Trend rollups are updated by :func:`record_search`, once per search. The
+    caller is responsible for committing the session.
+    """
+
+    results = list(results)
+    keywords = sorted({normalise_keyword(name) for name in keywords} - {""})
+    created_at = created_at or dt.datetime.utcnow()
+    negatives = [result for result in results if result.get("score")]
+    run = SearchRun(
+        user_id=user.id,
+        search_query=query[:255],
+        region=region,
+        result_count=len(results),
+        negative_count=len(negatives),
+        created_at=created_at,
+    )
+    db.session.add(run)
+    db.session.flush()
+
+    if keywords:
+        db.session.execute(
+            search_run_keywords.insert(),
+            [{"run_id": run.id, "keyword": keyword} for keyword in keywords],
+        )
+    if results:
+        db.session.execute(
+            db.insert(Mention),
+            [
+                {
+                    "run_id": run.id,
+                    "user_id": user.id,
+                    "position": result.get("id"),
+                    "url": result.get("url"),
+                    "canonical_url": result.get("canonical_url"),
+                    "headline": result.get("headline"),
+                    "snippet": result.get("snippet"),
+                    "score": result.get("score") or 0.0,
+                    "matched_terms": result.get("matched_terms") or [],
+                    "is_new": result.get("is_new", True),
+                    "created_at": created_at,
+                }
+                for result in results
+            ],
+        )
+        index_run_mentions(run.id)
+    return run
+
+
+def record_search(
+    user: Users,
+    query: str,
+    keywords: Iterable[str],
+    regional: Dict[Optional[str], List[dict]],
+) -> Dict[Optional[str], Dict[str, Optional[int]]]:
+    """Persist everything derived from a search and return own-link positions per region."""
+
+    keywords = sorted({normalise_keyword(name) for name in keywords} - {""})
+    everything = [result for found in regional.values() for result in found]
+    mark_seen_urls(user, everything)
+    created_at = dt.datetime.utcnow()
+    rankings = {}
+    for region, found in regional.items():
+        rankings[region] = record_rank_positions(user, found, region)
+        record_search_run(user, query, keywords, found, region, created_at)
+    apply_rollup_deltas(mention_rollup_deltas(user.id, keywords, created_at, everything))
+    db.session.commit()
+    return rankings
+
+
+def get_rank_history(
+    user: Users, region: Optional[str] = None, limit: int = 100
+) -> List[RankPosition]:
+    query = RankPosition.query.filter_by(user_id=user.id)
+    if region is not None:
+        query = query.filter_by(region=region)
+    return query.order_by(RankPosition.checked_at.desc(), RankPosition.id.desc()).limit(limit).all()
+
+
 def _extract_headline(headline: object, fallback: str) -> str:
     if isinstance(headline, dict):
         text = headline.get("hlword") or headline.get("#text")
@@ -112,8 +509,23 @@ def _extract_headline(headline: object, fallback: str) -> str:
 
 
 __all__ = [
+    "ProviderBusy",
     "add_keywords_to_user",
+    "build_user_query",
+    "collapse_duplicates",
     "delete_user_keywords",
+    "delete_users",
+    "find_own_link_positions",
+    "gc_orphan_keywords",
     "get_keywords_for_user",
+    "get_rank_history",
+    "get_user_regions",
+    "iter_batch_searches",
+    "load_users_with_keywords",
+    "mark_seen_urls",
+    "perform_regional_search",
     "perform_search",
+    "record_rank_positions",
+    "record_search",
+    "record_search_run",
 ]
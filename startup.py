@@ -0,0 +1,164 @@
+"""Cold-start instrumentation: timed initialisation steps, warm-up and a report.
+
+``create_app`` wraps each initialisation step in :func:`startup_step`, so the
+durations appear on ``/metrics`` as ``startup.<step>`` stages. With
+``WARMUP_ON_START=1`` the factory also loads the lazily imported subsystems
+before the first request instead of during it.
+
+The report runs ``create_app`` in a fresh interpreter under ``-X importtime``
+and fails when the cold start exceeds a budget::
+
+    python -m startup --budget 600
+    python -m startup --warmup --top 30
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from flask import Flask
+
+from metrics import time_stage
+
+REPO_ROOT = Path(__file__).resolve().parent
+FIRST_PARTY = {
+    path.stem for path in REPO_ROOT.glob("*.py") if path.stem not in ("__init__", "app")
+} | {"models"}
+
+STARTUP_STEPS: Dict[str, float] = {}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+_REPORT_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+from __init__ import create_app
+create_app()
+from startup import STARTUP_STEPS
+print(json.dumps({"create_app_ms": (time.perf_counter() - started) * 1000, "steps": STARTUP_STEPS}))
+"""
+
+
+@contextmanager
+def startup_step(name: str) -> Iterator[None]:
+    """Record how long initialisation step ``name`` takes."""
+
+    started = time.perf_counter()
+    with time_stage(f"startup.{name}"):
+        yield
+    STARTUP_STEPS[name] = round((time.perf_counter() - started) * 1000, 3)
+
+
+def warm_up(app: Flask) -> None:
+    """Load the PDF, XML and scoring subsystems and open a database connection."""
+
+    import pdf_loader
+    import xmlproxy
+    from models.models import db
+    from scoring import default_lexicon
+
+    with startup_step("warmup.pdf"):
+        try:
+            pdf_loader.warm_up()
+        except OSError as exc:
+            app.logger.warning("PDF warm-up skipped: %s", exc)
+    with startup_step("warmup.xml"):
+        xmlproxy.warm_up()
+    with startup_step("warmup.scoring"):
+        default_lexicon()
+    with startup_step("warmup.db"), app.app_context():
+        try:
+            with db.engine.connect():
+                pass
+        except Exception as exc:  # the API can start before the database is reachable
+            app.logger.warning("Database warm-up skipped: %s", exc)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Return ``(module, self_us, cumulative_us, depth)`` rows from ``-X importtime``."""
+
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            rows.append((module, int(own), int(cumulative), len(indent) // 2))
+    return rows
+
+
+def measure(warmup: bool = False) -> Dict[str, object]:
+    """Start the application in a fresh interpreter and collect its timings."""
+
+    env = dict(os.environ, WARMUP_ON_START="1" if warmup else "0")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _REPORT_SNIPPET],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    total_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"create_app failed:\n{completed.stderr[-2000:]}")
+
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report["total_ms"] = total_ms
+    report["imports"] = parse_importtime(completed.stderr)
+    return report
+
+
+def _print_report(report: Dict[str, object], top: int) -> None:
+    imports = report["imports"]
+    print(f"process start to ready   {report['total_ms']:9.1f} ms")
+    print(f"create_app (with imports) {report['create_app_ms']:8.1f} ms")
+
+    print("\ninitialisation steps (ms)")
+    for name, duration in report["steps"].items():
+        print(f"  {name:30} {duration:9.1f}")
+
+    print("\nfirst-party modules (cumulative ms)")
+    for module, _, cumulative, _ in sorted(imports, key=lambda row: -row[2]):
+        if module.split(".")[0] in FIRST_PARTY:
+            print(f"  {module:30} {cumulative / 1000:9.1f}")
+
+    print(f"\ntop {top} top-level imports (cumulative ms)")
+    top_level = [row for row in imports if row[3] == 0]
+    for module, _, cumulative, _ in sorted(top_level, key=lambda row: -row[2])[:top]:
+        print(f"  {module:30} {cumulative / 1000:9.1f}")
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Report cold-start import and init time.")
+    parser.add_argument("--budget", type=float, help="Fail when startup takes longer (ms).")
+    parser.add_argument("--top", type=int, default=15, help="Number of imports to list.")
+    parser.add_argument("--warmup", action="store_true", help="Include the warm-up step.")
+    parser.add_argument("--json", action="store_true", help="Print the raw report as JSON.")
+    args = parser.parse_args(argv)
+
+    report = measure(warmup=args.warmup)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report, args.top)
+
+    if args.budget is not None and report["total_ms"] > args.budget:
+        print(f"\nstartup took {report['total_ms']:.1f} ms, over the {args.budget:.0f} ms budget")
+        return 1
+    return 0
+
+
+__all__ = ["STARTUP_STEPS", "measure", "parse_importtime", "startup_step", "warm_up"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
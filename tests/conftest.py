@@ -0,0 +1,40 @@
+import pytest
+
+from models.models import Users, db
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # ``api.register_resources`` adds to a module-level Api, so build the app once.
+    database = tmp_path_factory.mktemp("db") / "test.sqlite"
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("DATABASE_URL", f"sqlite:///{database}")
+        from __init__ import create_app
+
+        return create_app()
+
+
+@pytest.fixture
+def database(app):
+    with app.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def make_user(database):
+    def make_user(telegram_id, **fields):
+        user = Users(
+            name="Иван",
+            surname="Иванов",
+            telegram_id=str(telegram_id),
+            phone=f"+7900{telegram_id:07d}",
+            city="Москва",
+            **fields,
+        )
+        user.save()
+        return user
+
+    return make_user
@@ -0,0 +1,104 @@
+import json
+
+import bulk
+from api import user_schema
+from bulk import import_users, iter_ndjson
+from keyword_stats import keyword_fingerprint, rebuild_keyword_stats
+from models.models import KeyWords, KeywordSetStat, Users, db
+from services import add_keywords_to_user, delete_user_keywords, delete_users
+
+
+def counters():
+    db.session.expire_all()
+    return (
+        {keyword.name: keyword.subscriber_count for keyword in KeyWords.query},
+        {user.telegram_id: user.keyword_fingerprint for user in Users.query},
+        {row.fingerprint: (row.keywords, row.users) for row in KeywordSetStat.query},
+    )
+
+
+def assert_counters_rebuild_unchanged():
+    maintained = counters()
+    rebuild_keyword_stats()
+    assert counters() == maintained
+    return maintained
+
+
+def ndjson(*records):
+    return iter_ndjson(json.dumps(record).encode("utf-8") for record in records)
+
+
+def imported_user(telegram_id, keywords):
+    return {
+        "name": "Пётр",
+        "surname": "Петров",
+        "telegram_id": str(telegram_id),
+        "phone": f"+7911{telegram_id:07d}",
+        "city": "Казань",
+        "keywords": keywords,
+    }
+
+
+def test_counters_match_rebuild_after_every_change(make_user):
+    first = make_user(1)
+    second = make_user(2)
+
+    add_keywords_to_user(first, ["Мэр", "взятка"])
+    add_keywords_to_user(second, ["мэр"])
+    keywords, fingerprints, sets = assert_counters_rebuild_unchanged()
+    assert keywords == {"мэр": 2, "взятка": 1}
+    assert fingerprints["1"] == keyword_fingerprint(["мэр", "взятка"])
+    assert sets[fingerprints["2"]] == (["мэр"], 1)
+
+    delete_user_keywords(first, ["взятка"])
+    keywords, fingerprints, sets = assert_counters_rebuild_unchanged()
+    assert keywords == {"мэр": 2, "взятка": 0}
+    assert fingerprints["1"] == fingerprints["2"]
+    assert sets == {fingerprints["1"]: (["мэр"], 2)}
+
+    report = import_users(
+        ndjson(
+            imported_user(3, ["мэр", "суд"]),
+            imported_user(4, ["Суд", "мэр"]),
+            imported_user(5, []),
+        ),
+        user_schema,
+        chunk_size=2,
+    )
+    assert report["imported"] == 3
+    keywords, fingerprints, sets = assert_counters_rebuild_unchanged()
+    assert keywords == {"мэр": 4, "взятка": 0, "суд": 2}
+    assert fingerprints["5"] is None
+    assert sets[fingerprints["3"]] == (["мэр", "суд"], 2)
+
+    delete_users([first.id, Users.find_by_telegram_id("3").id])
+    keywords, fingerprints, sets = assert_counters_rebuild_unchanged()
+    assert keywords == {"мэр": 2, "взятка": 0, "суд": 1}
+    assert sets == {fingerprints["2"]: (["мэр"], 1), fingerprints["4"]: (["мэр", "суд"], 1)}
+
+
+def test_import_skips_chunk_that_hits_a_concurrent_registration(make_user, monkeypatch):
+    insert_users = bulk._insert_users
+
+    def register_first_then_insert(payloads):
+        # Another request registers user 10 between validation and insert.
+        if payloads[0]["telegram_id"] == "10":
+            make_user(10)
+        return insert_users(payloads)
+
+    monkeypatch.setattr(bulk, "_insert_users", register_first_then_insert)
+    report = import_users(
+        ndjson(
+            imported_user(10, ["мэр"]),
+            imported_user(11, ["мэр"]),
+            imported_user(12, ["суд"]),
+        ),
+        user_schema,
+        chunk_size=2,
+    )
+
+    assert report["imported"] == 1
+    assert [error["line"] for error in report["errors"]] == [1, 2]
+    assert Users.find_by_telegram_id("11") is None
+    keywords, _, _ = assert_counters_rebuild_unchanged()
+    assert keywords == {"суд": 1}
@@ -0,0 +1,87 @@
+import pytest
+
+from scoring import NEGATIVE_LEXICON, NegativeLexicon, score_result, stem_term, stem_word
+
+
+@pytest.fixture(scope="module")
+def lexicon():
+    return NegativeLexicon(NEGATIVE_LEXICON)
+
+
+@pytest.mark.parametrize(
+    "word, stem",
+    [
+        ("задержан", "задерж"),
+        ("задержание", "задерж"),
+        ("коррупция", "коррупц"),
+        ("скандал", "скандал"),
+        ("слив", "слив"),
+        ("спам", "спам"),
+    ],
+)
+def test_stem_word(word, stem):
+    assert stem_word(word) == stem
+
+
+@pytest.mark.parametrize(
+    "term, pattern",
+    [
+        ("Уголовное дело", "уголовн дел"),
+        ("Взятка", "взятк"),
+        ("Мошенничество", "мошенниче"),
+    ],
+)
+def test_stem_term_stems_every_word(term, pattern):
+    assert stem_term(term) == pattern
+
+
+@pytest.mark.parametrize(
+    "text, terms",
+    [
+        ("Чиновник задержан за взятку", {"Задержан", "Взятка"}),
+        ("Задержаны мошенники", {"Задержан", "Мошенник"}),
+        ("После задержания мэра", {"Задержан"}),
+        ("Возбуждено уголовное дело", {"Уголовное дело"}),
+        ("В рамках уголовного дела", {"Уголовное дело"}),
+        ("Фигуранты уголовных дел", {"Уголовное дело"}),
+        ("Заподозрила мужа в измене", {"Измена"}),
+        ("Слив переписки", {"Слив"}),
+        ("Громкий скандал, коррупция!", {"Скандал", "Коррупция"}),
+        ("Изменение погоды", set()),
+        ("Правила изменились", set()),
+        ("Сливочное масло подорожало", set()),
+        ("Задержка рейса", set()),
+        ("Рейс задерживается", set()),
+        ("Зарплату задержали", set()),
+        ("Сливы подешевели", set()),
+        ("Уголовное право", set()),
+        ("Дело о разводе", set()),
+        ("Антикоррупционный форум", set()),
+    ],
+)
+def test_scan(lexicon, text, terms):
+    assert {term for term, _ in lexicon.scan(text)} == terms
+
+
+def test_scan_returns_surface_form(lexicon):
+    assert lexicon.scan("Материалы уголовного дела") == [("Уголовное дело", "уголовного дела")]
+
+
+def test_scan_counts_whole_word_form_once(lexicon):
+    assert lexicon.scan("Слива на рынке") == [("Слив", "слива")]
+
+
+@pytest.mark.parametrize(
+    "short, long",
+    [
+        ("Слив переписки", "Слива переписки"),
+        ("Обвинили в изменах", "Обвинили в изменами"),
+        ("Задержан мэр", "Задержанный мэр"),
+        ("Задержан мэр", "Задержания мэра"),
+    ],
+)
+def test_score_does_not_depend_on_word_ending(lexicon, short, long):
+    assert score_result({"headline": short}, lexicon)["score"] > 0
+    assert score_result({"headline": short}, lexicon)["score"] == score_result(
+        {"headline": long}, lexicon
+    )["score"]
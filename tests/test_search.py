@@ -0,0 +1,25 @@
+import json
+import threading
+
+import pytest
+
+import services
+from services import ProviderBusy, add_keywords_to_user
+
+
+def test_search_gives_up_when_provider_slots_stay_busy(app, make_user, monkeypatch):
+    monkeypatch.setattr(services, "PROVIDER_SLOTS", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(services, "SEARCH_SLOT_TIMEOUT", 0.01)
+    monkeypatch.setattr(services, "get_urls", lambda **kwargs: pytest.fail("provider called"))
+    add_keywords_to_user(make_user(1), ["мэр"])
+    services.PROVIDER_SLOTS.acquire()
+
+    with pytest.raises(ProviderBusy):
+        services.perform_search("Иванов Иван", ["мэр"])
+
+    response = app.test_client().post("/api/search", json={"telegram_id": "1"})
+    assert response.status_code == 503
+    assert response.get_json()["status"] == "provider_busy"
+
+    response = app.test_client().post("/api/search/batch", json={"telegram_ids": ["1"]})
+    assert [json.loads(line)["status"] for line in response.data.splitlines()] == ["search_error"]
@@ -0,0 +1,63 @@
+import datetime as dt
+
+import pytest
+
+from services import record_search
+from trends import backfill_rollups, bucket_start, get_trends
+from urlcanon import canonicalise_url
+
+
+def result(position, url, headline, score=1.0, snippet=""):
+    return {
+        "id": position,
+        "url": url,
+        "canonical_url": canonicalise_url(url),
+        "headline": headline,
+        "snippet": snippet,
+        "score": score,
+    }
+
+
+def rollup_counts(user, period):
+    return {row.keyword: (row.bucket, row.mentions) for row in get_trends(user.id, period)}
+
+
+@pytest.mark.parametrize("period", ["day", "week"])
+def test_rollups_count_each_new_canonical_url_once_per_keyword(make_user, period):
+    user = make_user(1, city2="Казань")
+    keywords = ["мэр", "взятка"]
+
+    record_search(
+        user,
+        "Иванов",
+        keywords,
+        {
+            "Москва": [
+                result(1, "https://news.ru/a", "Мэра обвинили во взятке"),
+                result(2, "https://news.ru/b", "Мэр уволен"),
+                result(3, "https://news.ru/c", "Погода в Москве", score=0.0),
+            ],
+            "Казань": [
+                result(1, "http://www.news.ru/a/?utm_source=tg", "Мэра обвинили во взятке"),
+            ],
+        },
+    )
+    record_search(
+        user,
+        "Иванов",
+        keywords,
+        {
+            "Москва": [
+                result(1, "https://news.ru/a", "Мэра обвинили во взятке"),
+                result(2, "https://news.ru/d", "Новая взятка", snippet="Подробности"),
+            ],
+            "Казань": [result(1, "https://m.news.ru/b", "Мэр уволен")],
+        },
+    )
+
+    bucket = bucket_start(dt.datetime.utcnow(), period)
+    expected = {"мэр": (bucket, 2), "взятка": (bucket, 2)}
+    assert rollup_counts(user, period) == expected
+
+    backfill_rollups(user.id)
+    assert rollup_counts(user, period) == expected
@@ -0,0 +1,56 @@
+import pytest
+
+from services import collapse_duplicates
+from urlcanon import canonicalise_url, url_hash
+
+
+@pytest.mark.parametrize(
+    "url, canonical",
+    [
+        ("http://www.example.ru/news/1", "https://example.ru/news/1"),
+        ("https://m.example.ru/news/1/", "https://example.ru/news/1"),
+        ("https://example.ru:443/news/1", "https://example.ru/news/1"),
+        ("https://amp.example.ru/amp/news/1", "https://example.ru/news/1"),
+        ("https://example.ru/news/1.amp", "https://example.ru/news/1"),
+        ("https://example.ru/news/1?amp=1", "https://example.ru/news/1"),
+        ("https://example.ru/news?id=2&utm_source=tg&ysclid=abc", "https://example.ru/news?id=2"),
+        ("https://example.ru/news?b=2&a=1", "https://example.ru/news?a=1&b=2"),
+        ("https://example.ru/news#comments", "https://example.ru/news"),
+        ("https://www.ru/", "https://www.ru/"),
+        ("", ""),
+        (None, ""),
+    ],
+)
+def test_canonicalise_url(url, canonical):
+    assert canonicalise_url(url) == canonical
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("https://forum.example.ru/topic?from=10", "https://forum.example.ru/topic?from=20"),
+        ("https://example.ru/list?ref=abc", "https://example.ru/list?ref=def"),
+        ("https://example.ru/feed?rss=1", "https://example.ru/feed"),
+        ("https://example.ru/a", "https://example.ru/b"),
+    ],
+)
+def test_content_parameters_keep_pages_apart(first, second):
+    assert canonicalise_url(first) != canonicalise_url(second)
+
+
+def test_url_hash_is_signed_64_bit():
+    hashed = url_hash("https://example.ru/news/1")
+    assert -(2**63) <= hashed < 2**63
+    assert hashed == url_hash("https://example.ru/news/1")
+
+
+def test_collapse_duplicates_keeps_results_without_url():
+    results = [
+        {"id": 1, "url": "https://www.example.ru/news/1"},
+        {"id": 2, "url": None},
+        {"id": 3, "url": "http://example.ru/news/1"},
+        {"id": 4, "url": ""},
+    ]
+    collapsed = collapse_duplicates(results)
+    assert [result["id"] for result in collapsed] == [1, 2, 4]
+    assert collapsed[0]["aliases"] == ["http://example.ru/news/1"]
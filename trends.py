@@ -0,0 +1,174 @@
+"""Time-bucketed rollups of negative mentions used for trend charts.
+
+A new negative mention counts once per canonical URL, even when several
+regional searches returned it, and only for the keywords that appear in its
+headline or snippet.
+"""
+from __future__ import annotations
+
+import datetime as dt
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from models.models import Mention, MentionRollup, db, search_run_keywords, upsert
+from scoring import NegativeLexicon
+
+PERIODS = ("day", "week", "month")
+BACKFILL_CHUNK_SIZE = 5000
+UPSERT_CHUNK_SIZE = 1000
+
+RollupKey = Tuple[int, str, str, dt.date]
+
+
+def bucket_start(moment: dt.datetime | dt.date, period: str) -> dt.date:
+    """Return the first day of the ``period`` bucket containing ``moment``."""
+
+    day = moment.date() if isinstance(moment, dt.datetime) else moment
+    if period == "day":
+        return day
+    if period == "week":
+        return day - dt.timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def rollup_deltas(
+    user_id: int, keywords: Iterable[str], moment: dt.datetime, mentions: int
+) -> Counter:
+    deltas: Counter = Counter()
+    if not mentions:
+        return deltas
+    for keyword in set(keywords):
+        for period in PERIODS:
+            deltas[(user_id, period, keyword, bucket_start(moment, period))] += mentions
+    return deltas
+
+
+@lru_cache(maxsize=256)
+def _keyword_lexicon(keywords: Tuple[str, ...]) -> NegativeLexicon:
+    return NegativeLexicon({keyword: 1.0 for keyword in keywords}, {})
+
+
+def keywords_in_text(keywords: Iterable[str], *texts: object) -> Set[str]:
+    """Return the ``keywords`` found, stemmed, in any of ``texts``."""
+
+    lexicon = _keyword_lexicon(tuple(sorted(set(keywords))))
+    return {term for text in texts for term, _ in lexicon.scan(str(text or ""))}
+
+
+def mention_rollup_deltas(
+    user_id: int,
+    keywords: Iterable[str],
+    moment: dt.datetime,
+    results: Iterable[Mapping[str, object]],
+) -> Counter:
+    """Return the rollup deltas for one search, whatever the number of regions."""
+
+    keywords = list(keywords)
+    deltas: Counter = Counter()
+    counted: set = set()
+    for result in results:
+        if not result.get("score") or not result.get("is_new", True):
+            continue
+        key = result.get("canonical_url") or id(result)
+        if key in counted:
+            continue
+        counted.add(key)
+        matched = keywords_in_text(keywords, result.get("headline"), result.get("snippet"))
+        deltas.update(rollup_deltas(user_id, matched, moment, 1))
+    return deltas
+
+
+def apply_rollup_deltas(deltas: Dict[RollupKey, int]) -> None:
+    """Add ``deltas`` to the rollup table with a single upsert statement."""
+
+    if not deltas:
+        return
+    rows = [
+        {"user_id": user_id, "period": period, "keyword": keyword, "bucket": bucket, "mentions": count}
+        for (user_id, period, keyword, bucket), count in deltas.items()
+    ]
+    upsert(
+        MentionRollup,
+        rows,
+        ["user_id", "period", "keyword", "bucket"],
+        set_=lambda excluded: {
+            "mentions": MentionRollup.__table__.c.mentions + excluded.mentions
+        },
+    )
+
+
+def get_trends(
+    user_id: int,
+    period: str = "day",
+    keyword: Optional[str] = None,
+    since: Optional[dt.date] = None,
+    until: Optional[dt.date] = None,
+) -> List[MentionRollup]:
+    query = MentionRollup.query.filter_by(user_id=user_id, period=period)
+    if keyword is not None:
+        query = query.filter_by(keyword=keyword)
+    if since is not None:
+        query = query.filter(MentionRollup.bucket >= bucket_start(since, period))
+    if until is not None:
+        query = query.filter(MentionRollup.bucket <= until)
+    return query.order_by(MentionRollup.keyword, MentionRollup.bucket).all()
+
+
+def backfill_rollups(user_id: Optional[int] = None) -> int:
+    """Rebuild rollups from stored mentions and return the number of rows written."""
+
+    delete = db.delete(MentionRollup)
+    if user_id is not None:
+        delete = delete.where(MentionRollup.user_id == user_id)
+    db.session.execute(delete)
+
+    query = (
+        db.select(
+            Mention.id,
+            Mention.user_id,
+            Mention.canonical_url,
+            Mention.headline,
+            Mention.snippet,
+            Mention.created_at,
+            search_run_keywords.c.keyword,
+        )
+        .join(search_run_keywords, search_run_keywords.c.run_id == Mention.run_id)
+        .where(Mention.score > 0, Mention.is_new.is_(True))
+        .order_by(Mention.id)
+        .execution_options(yield_per=BACKFILL_CHUNK_SIZE)
+    )
+    if user_id is not None:
+        query = query.where(Mention.user_id == user_id)
+
+    totals: Counter = Counter()
+    # Regional copies of a mention are all flagged new; count the first one.
+    counted: set = set()
+    for mention_id, row_user_id, canonical, headline, snippet, created_at, keyword in (
+        db.session.execute(query)
+    ):
+        key = (row_user_id, canonical or mention_id, keyword)
+        if key in counted or not keywords_in_text([keyword], headline, snippet):
+            continue
+        counted.add(key)
+        totals.update(rollup_deltas(row_user_id, [keyword], created_at, 1))
+
+    keys = list(totals)
+    for offset in range(0, len(keys), UPSERT_CHUNK_SIZE):
+        chunk = keys[offset : offset + UPSERT_CHUNK_SIZE]
+        apply_rollup_deltas({key: totals[key] for key in chunk})
+    db.session.commit()
+    return len(keys)
+
+
+__all__ = [
+    "PERIODS",
+    "apply_rollup_deltas",
+    "backfill_rollups",
+    "get_trends",
+    "keywords_in_text",
+    "mention_rollup_deltas",
+    "rollup_deltas",
+]
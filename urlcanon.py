@@ -0,0 +1,84 @@
+"""URL canonicalisation used to collapse duplicate search results."""
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Parameters set by ad, analytics and share tools; they never change the page.
+TRACKING_PARAMS = frozenset(
+    {
+        "_openstat",
+        "dclid",
+        "fbclid",
+        "gclid",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "msclkid",
+        "ref_src",
+        "utm",
+        "yclid",
+        "ysclid",
+    }
+)
+# Switches that select the AMP rendering of the same page.
+AMP_PARAMS = frozenset({"amp", "outputtype"})
+TRACKING_PREFIXES = ("utm_",)
+MIRROR_HOST_PREFIXES = ("www.", "m.", "mobile.", "amp.", "pda.")
+DEFAULT_PORTS = {"80", "443"}
+
+
+def _canonical_host(netloc: str) -> str:
+    host = netloc.rsplit("@", 1)[-1].lower()
+    if ":" in host:
+        name, _, port = host.rpartition(":")
+        if port in DEFAULT_PORTS:
+            host = name
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in MIRROR_HOST_PREFIXES:
+            if host.startswith(prefix) and host.count(".") > 1:
+                host = host[len(prefix):]
+                stripped = True
+    return host.rstrip(".")
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name in AMP_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalise_url(url: Optional[str]) -> str:
+    """Return a canonical form of ``url`` shared by its http/https, www, AMP and mobile mirrors."""
+
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    if not parts.netloc:
+        return url.strip()
+
+    segments = [segment for segment in parts.path.split("/") if segment and segment.lower() != "amp"]
+    path = "/" + "/".join(segments)
+    if path.endswith(".amp"):
+        path = path[: -len(".amp")]
+
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not _is_tracking_param(name)
+        )
+    )
+    return urlunsplit(("https", _canonical_host(parts.netloc), path, query, ""))
+
+
+def url_hash(canonical_url: str) -> int:
+    """Return a signed 64-bit hash suitable for a ``BIGINT`` column."""
+
+    digest = hashlib.blake2b(canonical_url.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+__all__ = ["canonicalise_url", "url_hash"]
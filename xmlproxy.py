@@ -6,19 +6,86 @@ import os
 from typing import Optional
 
 import requests
-import xmltodict
+
+from metrics import UPSTREAM_ERRORS, time_stage
 
 USER_API: str = os.getenv("XMLPROXY_URL", "http://xmlproxy.ru/search/")
 
+# Yandex ``lr`` region codes for the cities users most often register with.
+CITY_REGION_IDS = {
+    "москва": 213,
+    "санкт-петербург": 2,
+    "новосибирск": 65,
+    "екатеринбург": 54,
+    "казань": 43,
+    "нижний новгород": 47,
+    "челябинск": 56,
+    "самара": 51,
+    "омск": 66,
+    "ростов-на-дону": 39,
+    "уфа": 172,
+    "красноярск": 62,
+    "воронеж": 193,
+    "пермь": 50,
+    "волгоград": 38,
+    "краснодар": 35,
+    "саратов": 194,
+    "тюмень": 55,
+    "ижевск": 44,
+    "иркутск": 63,
+    "владивосток": 75,
+    "хабаровск": 76,
+    "калининград": 22,
+    "сочи": 239,
+}
+
+
+def region_id_for_city(city: str) -> Optional[int]:
+    """Return the Yandex region code for ``city`` if it is known."""
 
-def get_urls(query: str, user_api: Optional[str] = None, timeout: int = 30) -> str:
+    return CITY_REGION_IDS.get(city.strip().lower().replace("ё", "е"))
+
+
+def get_urls(
+    query: str,
+    user_api: Optional[str] = None,
+    timeout: int = 30,
+    region: Optional[int] = None,
+) -> str:
     """Return the XMLProxy response serialised to JSON."""
 
     base_url = user_api or USER_API
-    response = requests.get(f"{base_url}&query={query}", timeout=timeout)
-    response.raise_for_status()
-    parsed = xmltodict.parse(response.text)
-    return json.dumps(parsed, ensure_ascii=False)
+    url = f"{base_url}&query={query}"
+    if region is not None:
+        url += f"&lr={region}"
+    try:
+        with time_stage("get_urls.fetch"):
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+    except requests.Timeout:
+        UPSTREAM_ERRORS.inc(reason="timeout")
+        raise
+    except requests.HTTPError:
+        UPSTREAM_ERRORS.inc(reason=f"http_{response.status_code}")
+        raise
+    except requests.RequestException:
+        UPSTREAM_ERRORS.inc(reason="connection")
+        raise
+
+    import xmltodict  # deferred so that startup does not pay for it
+
+    with time_stage("get_urls.parse_xml"):
+        parsed = xmltodict.parse(response.text)
+    with time_stage("get_urls.serialise"):
+        return json.dumps(parsed, ensure_ascii=False)
+
+
+def warm_up() -> None:
+    """Load the XML parser ahead of the first search."""
+
+    import xmltodict
+
+    xmltodict.parse("<yandexsearch/>")
 
 
-__all__ = ["get_urls"]
+__all__ = ["get_urls", "region_id_for_city", "warm_up"]